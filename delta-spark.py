@@ -8,121 +8,664 @@
 # Gabi Zapodeanu, TSA, Global Partner Organization
 
 
-from cli import cli
+import os
+import sys
 import time
+import socket
+import re
+import collections
 import difflib
-import requests
+import hashlib
+import zlib
+import argparse
 import json
-import urllib3
 
-from code_init import SPARK_URL, SPARK_AUTH, SPARK_ROOM
+# cli, requests, urllib3 and code_init are imported where they are used, so "--notify", run for each
+# configuration change, only loads the standard library modules
 
-from urllib3.exceptions import InsecureRequestWarning
+# config lines not compared: comments, and the lines that change without a configuration change
 
-urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
+IGNORE_LINES = re.compile(r'^\s*(!|Building configuration|Current configuration|Last configuration change'
+                          r'|NVRAM config last updated|ntp clock-period)')
 
+# config history: directory, a full copy is saved every CHECKPOINT_EVERY versions, or when the delta is larger than
+# CHECKPOINT_RATIO of the full copy, and the versions older than RETENTION_DAYS are deleted, keeping RETENTION_MIN
 
-def save_config():
+HISTORY_DIR = '/bootflash/config_history'
+CHECKPOINT_EVERY = 20
+CHECKPOINT_RATIO = 0.5
+RETENTION_DAYS = 90
+RETENTION_MIN = 20
+
+# %SYS-5-CONFIG_I syslog messages, with or without the sequence numbers, and the file with the last message read
+
+CONFIG_EVENT = re.compile(r'^\s*(?:(?P<seq>\d+): )?[*.]?(?P<time>.+?): %SYS-5-CONFIG_I: Configured from '
+                          r'(?P<source>\S+) by (?P<user>\S+)(?: on (?P<line>\S+))?(?: \((?P<address>[^)]+)\))?')
+LOG_CURSOR_FILE = '/bootflash/config_log_cursor.json'
+
+# daemon mode: the change notifications are received on this local UDP port, a burst of notifications is processed
+# once, DEBOUNCE_QUIET seconds after the last notification, or DEBOUNCE_MAX_WAIT seconds after the first one
 
-    # save running configuration, use local time to create new config file name
+DAEMON_ADDRESS = ('127.0.0.1', 10514)
+DEBOUNCE_QUIET = 10
+DEBOUNCE_MAX_WAIT = 60
+
+# Spark messages: maximum message size in UTF-8 bytes, number of retries and the retry delays in seconds,
+# and the file caching the room ids
+
+MESSAGE_LIMIT = 7000
+SPARK_RETRIES = 4
+SPARK_RETRY_DELAY = 1
+SPARK_RETRY_MAX_DELAY = 30
+
+# the requests with these methods are retried on server errors and on connection errors, the other requests, like
+# the message posts, only when rate limited or when the connection failed before the request was sent
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+ROOM_CACHE_FILE = '/bootflash/spark_rooms.json'
+
+
+class ConfigStore(object):
+
+    # configuration history: each config is saved once, compressed, named by its SHA1
+    # the configs are saved without the IGNORE_LINES lines, so the configs differing only by the comments and the
+    # "Current configuration" header have the same SHA1
+    # a config is saved as a full copy (checkpoint), or as a delta against the last checkpoint,
+    # so any version is rebuilt from one checkpoint and at most one delta
+    # index.json lists the versions: number, time, config SHA1, and the checkpoint SHA1 for the deltas
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.index_file = os.path.join(directory, 'index.json')
+        self.index = {'versions': [], 'objects': {}}
+        if os.path.isfile(self.index_file):
+            f = open(self.index_file)
+            self.index = json.load(f)
+            f.close()
+
+    def _write(self, name, data):
+
+        # write to a temporary file first, so an interrupted write never leaves a partial file
+
+        path = os.path.join(self.directory, name)
+        f = open(path + '.tmp', 'wb')
+        f.write(data)
+        f.close()
+        os.rename(path + '.tmp', path)
+
+    def _read(self, name):
+        f = open(os.path.join(self.directory, name), 'rb')
+        data = f.read()
+        f.close()
+        return zlib.decompress(data).decode('utf-8')
+
+    def _save_index(self):
+        self._write('index.json', json.dumps(self.index).encode('utf-8'))
+
+    def _checkpoint(self):
+
+        # the last checkpoint SHA1, and the number of versions saved since
+
+        for count, version in enumerate(reversed(self.index['versions'])):
+            if self.index['objects'][version['sha']]['base'] is None:
+                return version['sha'], count
+        return None, 0
+
+    def save(self, config, timestr=None):
+
+        # add a version, return its number
+
+        if isinstance(config, bytes):
+            config = config.decode('utf-8')
+        config = normalize_config(config)
+        data = config.encode('utf-8')
+        sha = hashlib.sha1(data).hexdigest()
+        if sha not in self.index['objects']:
+            full = zlib.compress(data, 9)
+            base, count = self._checkpoint()
+            obj = None
+            if base is not None and count < CHECKPOINT_EVERY:
+                delta = zlib.compress(json.dumps(self._delta(self.get_object(base), config)).encode('utf-8'), 9)
+                if len(delta) <= CHECKPOINT_RATIO * len(full):
+                    obj = {'base': base, 'file': sha + '.delta.z'}
+                    self._write(obj['file'], delta)
+            if obj is None:
+                obj = {'base': None, 'file': sha + '.full.z'}
+                self._write(obj['file'], full)
+            self.index['objects'][sha] = obj
+        versions = self.index['versions']
+        number = versions[-1]['version'] + 1 if versions else 1
+        versions.append({'version': number, 'time': timestr or time.strftime("%Y%m%d-%H%M%S"), 'sha': sha})
+        self._save_index()
+        return number
+
+    def _delta(self, base, config):
+
+        # line based delta: copy the base lines i1 to i2 ["c", i1, i2], or insert new lines ["i", lines]
+
+        base_lines = base.splitlines(True)
+        lines = config.splitlines(True)
+        ops = []
+        matcher = difflib.SequenceMatcher(None, base_lines, lines)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                ops.append(['c', i1, i2])
+            elif j2 > j1:
+                ops.append(['i', lines[j1:j2]])
+        return ops
+
+    def get_object(self, sha):
+
+        # rebuild the config with the SHA1 {sha}
+
+        obj = self.index['objects'][sha]
+        if obj['base'] is None:
+            return self._read(obj['file'])
+        base_lines = self.get_object(obj['base']).splitlines(True)
+        lines = []
+        for op in json.loads(self._read(obj['file'])):
+            if op[0] == 'c':
+                lines.extend(base_lines[op[1]:op[2]])
+            else:
+                lines.extend(op[1])
+        return ''.join(lines)
+
+    def versions(self):
+        return self.index['versions']
+
+    def get(self, number):
+
+        # rebuild the config version {number}, negative numbers count from the last version, -1 is the last one
+
+        versions = self.index['versions']
+        if number < 0:
+            return self.get_object(versions[number]['sha'])
+        for version in versions:
+            if version['version'] == number:
+                return self.get_object(version['sha'])
+        raise KeyError('No config version ' + str(number))
+
+    def diff(self, number1, number2):
+
+        # compare two config versions
+
+        return compare_configs(self.get(number1).splitlines(True), self.get(number2).splitlines(True))
+
+    def gc(self, retention_days=RETENTION_DAYS, retention_min=RETENTION_MIN):
+
+        # delete the versions older than {retention_days}, keeping at least {retention_min} versions,
+        # then delete the files not used by the remaining versions
+
+        versions = self.index['versions']
+        oldest = time.strftime("%Y%m%d-%H%M%S", time.localtime(time.time() - retention_days * 86400))
+        keep = [version for index, version in enumerate(versions)
+                if version['time'] >= oldest or index >= len(versions) - retention_min]
+        used = set()
+        for version in keep:
+            sha = version['sha']
+            while sha is not None and sha not in used:
+                used.add(sha)
+                sha = self.index['objects'][sha]['base']
+        unused = [sha for sha in self.index['objects'] if sha not in used]
+        self.index['versions'] = keep
+        objects = self.index['objects']
+        self.index['objects'] = dict((sha, obj) for sha, obj in objects.items() if sha in used)
+        self._save_index()
+        for sha in unused:
+            path = os.path.join(self.directory, objects[sha]['file'])
+            if os.path.isfile(path):
+                os.remove(path)
+        return len(versions) - len(keep)
+
+
+def save_config(store):
+
+    # save running configuration in the config history, delete the old versions, return the version number
+
+    from cli import cli
 
     output = cli('show run')
-    timestr = time.strftime("%Y%m%d-%H%M%S")
-    filename = "/bootflash/" + timestr + "_shrun"
+    version = store.save(output)
+    store.gc()
+    return version
 
-    f = open(filename,"w")
-    f.write(output)
-    f.close
 
-    f = open('/bootflash/current_config_name','w')
-    f.write(filename)
-    f.close
+def parse_config_event(line):
 
-    return filename
+    # parse a %SYS-5-CONFIG_I message, return a dict with the user, source, time, line, address and text, or None
 
+    match = CONFIG_EVENT.match(line)
+    if match is None:
+        return None
+    event = match.groupdict()
+    event['seq'] = int(event['seq']) if event['seq'] else None
+    event['text'] = line.strip()
+    return event
 
-def compare_configs(cfg1, cfg2):
 
-    # compare two config files
+def load_log_cursor(filename=LOG_CURSOR_FILE):
 
-    d = difflib.unified_diff(cfg1, cfg2)
+    # the last %SYS-5-CONFIG_I message read, None if not saved yet
 
-    diffstr = ""
+    if not os.path.isfile(filename):
+        return None
+    f = open(filename)
+    cursor = json.load(f)
+    f.close()
+    return cursor
 
-    for line in d:
-        if line.find('Current configuration') == -1:
-            if line.find('Last configuration change') == -1:
-                if (line.find("+++") == -1) and (line.find("---") == -1):
-                    if (line.find("-!") == -1) and (line.find('+!') == -1):
-                       if line.startswith('+'):
-                            diffstr = diffstr + "\n" + line
-                       elif line.startswith('-'):
-                            diffstr = diffstr + "\n" + line
 
-    return diffstr
+def save_log_cursor(cursor, filename=LOG_CURSOR_FILE):
+    f = open(filename + '.tmp', 'w')
+    json.dump(cursor, f)
+    f.close()
+    os.rename(filename + '.tmp', filename)
 
 
-def get_room_id(room_name):
+def get_config_events(cursor):
 
-    # find the Spark room id for the room with the name {room_name}
+    # return the %SYS-5-CONFIG_I messages logged after the {cursor} message, and the new cursor
+    # the new messages are the ones after the last occurrence of the cursor message, the message text includes
+    # the time and the logging sequence number, if enabled ("service sequence-numbers")
+    # all the messages are new when the cursor message is not in the buffer: it left the buffer, or the device
+    # reloaded, the sequence numbers are not compared, as they restart after a reload
+    # without a cursor, only the last message is returned
 
-    payload = {'title': room_name}
-    room_number = None
-    url = SPARK_URL + '/rooms'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    room_response = requests.get(url, data=json.dumps(payload), headers=header, verify=False)
-    room_list_json = room_response.json()
-    room_list = room_list_json['items']
-    for rooms in room_list:
-        if rooms['title'] == room_name:
-            room_number = rooms['id']
-    return room_number
+    from cli import cli
 
+    events = []
+    for line in cli("show logging | in %SYS-5-CONFIG_I").split("\n"):
+        event = parse_config_event(line)
+        if event is not None:
+            events.append(event)
+    if not events:
+        return [], cursor
+    if cursor is None:
+        events = events[-1:]
+    else:
+        texts = [event['text'] for event in events]
+        if cursor['text'] in texts:
+            events = events[len(texts) - texts[::-1].index(cursor['text']):]
+    new_cursor = {'seq': events[-1]['seq'], 'text': events[-1]['text']} if events else cursor
+    return events, new_cursor
 
-def post_room_message(room_id, message):
 
-    # post message to the Spark room with the room id
+def format_config_event(event):
+    text = event['user'] + ' from ' + event['source']
+    if event['line']:
+        text += ' on ' + event['line']
+    if event['address']:
+        text += ' (' + event['address'] + ')'
+    return text + ' at ' + event['time']
 
-    payload = {'roomId': room_id, 'text': message}
-    url = SPARK_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': SPARK_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
 
+def normalize_config(config):
 
-if __name__ == '__main__':
+    # return the config text without the IGNORE_LINES lines
+
+    return ''.join(line for line in config.splitlines(True) if not IGNORE_LINES.match(line))
+
+
+def parse_config(cfg):
+
+    # yield each config line with its section, the lines of the parent sections, using the IOS indentation
+
+    parents = []
+    for line in cfg:
+        text = line.rstrip()
+        if not text:
+            continue
+        indent = len(text) - len(text.lstrip())
+        while parents and parents[-1][0] >= indent:
+            parents.pop()
+        if IGNORE_LINES.match(text):
+            continue
+        text = text.strip()
+        yield tuple(parent for parent_indent, parent in parents), text
+        parents.append((indent, text))
+
+
+def diff_configs(cfg1, cfg2):
+
+    # compare two configs, by section, the lines of each changed section are compared in order,
+    # the order is meaningful in the access lists, prefix lists and route maps
+    # returns a list of (section, removed lines, added lines), the section is the tuple of the parent lines
+
+    sections = collections.OrderedDict()
+    for section, line in parse_config(cfg1):
+        sections.setdefault(section, ([], []))[0].append(line)
+    for section, line in parse_config(cfg2):
+        sections.setdefault(section, ([], []))[1].append(line)
+
+    changes = []
+    for section, (old_lines, new_lines) in sections.items():
+        if old_lines == new_lines:
+            continue
+        removed = []
+        added = []
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+            if tag != 'equal':
+                removed.extend(old_lines[old_start:old_end])
+                added.extend(new_lines[new_start:new_end])
+        changes.append((section, removed, added))
+    return changes
 
-    syslog_input = cli("show logging | in %SYS-5-CONFIG_I")                                                     
-    syslog_lines = syslog_input.split("\n")                     
-    lines_no = len(syslog_lines)-2                                
-    user_info = syslog_lines[lines_no]
+
+def format_changes(changes):
+
+    # format the config changes, each section followed by its removed "-" and added "+" lines
+
+    lines = []
+    for section, removed, added in changes:
+        for level, parent in enumerate(section):
+            lines.append(' ' + ' ' * level + parent)
+        indent = ' ' * len(section)
+        lines.extend('-' + indent + line for line in removed)
+        lines.extend('+' + indent + line for line in added)
+    return '\n'.join(lines)
+
+
+def compare_configs(cfg1, cfg2):
+
+    # compare two configs, return the changes as text
+
+    return format_changes(diff_configs(cfg1, cfg2))
+
+
+def split_message(message, limit=MESSAGE_LIMIT):
+
+    # split the message in parts of up to {limit} bytes, UTF-8 encoded, at the line ends when possible
+    # the Spark message limit is in bytes, the lines with non ASCII characters are longer than their length
+
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', 'replace')
+    parts = []
+    part = []
+    size = 0
+    for line in message.splitlines(True):
+        line_size = len(line.encode('utf-8'))
+        while line_size > limit:
+            if part:
+                parts.append(''.join(part))
+                part = []
+                size = 0
+
+            # cut at {limit} bytes, the character cut in the middle, if any, starts the next part
+
+            head = line.encode('utf-8')[:limit].decode('utf-8', 'ignore')
+            parts.append(head)
+            line = line[len(head):]
+            line_size = len(line.encode('utf-8'))
+        if part and size + line_size > limit:
+            parts.append(''.join(part))
+            part = []
+            size = 0
+        part.append(line)
+        size += line_size
+    if part:
+        parts.append(''.join(part))
+    return parts
+
+
+def is_connect_error(exception):
+
+    # True if the requests ConnectionError {exception} was raised before the request was sent:
+    # connection timeout, connection refused, or name resolution failure
+
+    import requests
+    import urllib3
+
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exception.args[0] if exception.args else None, 'reason', None)
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class SparkClient(object):
+
+    # Spark REST API client, one HTTP session for all the requests
+    # the room ids are cached, in memory and in ROOM_CACHE_FILE, and looked up again when a room is not found
+    # the requests are retried when rate limited (429), and the idempotent requests on server errors (5xx)
+
+    def __init__(self, url=None, auth=None, cache_file=ROOM_CACHE_FILE):
+
+        # the Spark URL and authorization header, default the code_init values
+
+        import requests
+        import urllib3
+        from urllib3.exceptions import InsecureRequestWarning
+        from code_init import SPARK_URL, SPARK_AUTH
+
+        urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
+        self.url = url or SPARK_URL
+        auth = auth or SPARK_AUTH
+        self.cache_file = cache_file
+        self.session = requests.Session()
+        self.session.headers.update({'content-type': 'application/json', 'authorization': auth})
+        self.session.verify = False
+        self.rooms = {}
+        if cache_file and os.path.isfile(cache_file):
+            f = open(cache_file)
+            self.rooms = json.load(f)
+            f.close()
+
+    def _save_rooms(self):
+        if not self.cache_file:
+            return
+        f = open(self.cache_file + '.tmp', 'w')
+        json.dump(self.rooms, f)
+        f.close()
+        os.rename(self.cache_file + '.tmp', self.cache_file)
+
+    def request(self, method, url, **kwargs):
+
+        # send the request, retry on 429, and on 5xx for the idempotent methods, using the Retry-After header
+        # a failed connection is retried if the request was not sent, the posts could else be duplicated
+
+        import requests
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code != 429 and (response.status_code < 500 or not idempotent):
+                    return response
+                error = str(response.status_code)
+                retry_after = response.headers.get('Retry-After')
+            except requests.exceptions.ConnectionError as exception:
+                if not idempotent and not is_connect_error(exception):
+                    raise
+                error = str(exception)
+                retry_after = None
+            if attempt >= SPARK_RETRIES:
+                raise requests.exceptions.HTTPError('Spark request failed: ' + error)
+            delay = min(SPARK_RETRY_MAX_DELAY, SPARK_RETRY_DELAY * 2 ** attempt)
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(delay)
+            attempt += 1
+
+    def get_room_id(self, room_name):
+
+        # find the Spark room id for the room with the name {room_name}, None if not found
+        # the room list is read page by page, following the "next" links
+
+        if room_name in self.rooms:
+            return self.rooms[room_name]
+        room_number = None
+        url = self.url + '/rooms'
+        params = {'max': 1000}
+        while url and room_number is None:
+            room_response = self.request('GET', url, params=params)
+            room_response.raise_for_status()
+            for rooms in room_response.json()['items']:
+                if rooms['title'] == room_name:
+                    room_number = rooms['id']
+            url = room_response.links.get('next', {}).get('url')
+            params = None
+        if room_number is not None:
+            self.rooms[room_name] = room_number
+            self._save_rooms()
+        return room_number
+
+    def post_room_message(self, room_name, message):
+
+        # post the message to the Spark room with the name {room_name}, split if larger than MESSAGE_LIMIT
+        # the parts are posted in order, the room id is looked up again if the cached room is not found
+
+        for part in split_message(message) or [message]:
+            retry = True
+            while True:
+                room_id = self.get_room_id(room_name)
+                if room_id is None:
+                    raise ValueError('Spark room not found: ' + room_name)
+                payload = {'roomId': room_id, 'text': part}
+                response = self.request('POST', self.url + '/messages', data=json.dumps(payload))
+                if response.status_code == 404 and retry and room_name in self.rooms:
+                    del self.rooms[room_name]
+                    self._save_rooms()
+                    retry = False
+                    continue
+                response.raise_for_status()
+                break
+
+
+def process_changes(config_store, log_cursor, spark):
+
+    # save the running config, compare it with the baseline config, post the changes to the Spark room
+    # return the new syslog cursor
+
+    from cli import cli
+    from code_init import SPARK_ROOM
+
+    # the configuration changes logged since the last run
+
+    config_events, log_cursor = get_config_events(log_cursor)
+    if config_events:
+        user_info = 'Configured by: ' + ', '.join(format_config_event(event) for event in config_events)
+    else:
+        user_info = 'Configured by: unknown, no new %SYS-5-CONFIG_I message'
 
     old_cfg_fn = "/bootflash/base-config"
-    new_cfg_fn = save_config()
+    new_version = save_config(config_store)
 
     f = open(old_cfg_fn)
     old_cfg = f.readlines()
-    f.close
+    f.close()
 
-    f = open(new_cfg_fn)
-    new_cfg = f.readlines()
-    f.close
+    new_cfg = config_store.get(new_version).splitlines(True)
 
-    diff =  compare_configs(old_cfg,new_cfg)
-    print diff
+    diff = compare_configs(old_cfg, new_cfg)
+    print (diff)
 
     f = open("/bootflash/diff","w")
     f.write(diff)
-    f.close
+    f.close()
 
     device_name = cli("show run | in hostname")
-    print device_name
+    print (device_name)
+
+    spark.post_room_message(SPARK_ROOM, "The device with the " + device_name + " has these configuration changes:")
+    spark.post_room_message(SPARK_ROOM, diff or "No configuration changes")
+    spark.post_room_message(SPARK_ROOM, "   ")
+
+    spark.post_room_message(SPARK_ROOM, user_info)
+
+    if log_cursor is not None:
+        save_log_cursor(log_cursor)
+    return log_cursor
+
+
+def notify_daemon(address=DAEMON_ADDRESS):
+
+    # send a change notification to the daemon, return False if the daemon is not running
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(address)
+
+        # the port is free, the daemon is not running
+
+        return False
+    except socket.error:
+        sock.sendto(b'change', address)
+        return True
+    finally:
+        sock.close()
+
+
+def wait_for_changes(sock, quiet=DEBOUNCE_QUIET, max_wait=DEBOUNCE_MAX_WAIT):
+
+    # wait for a change notification, then for the end of the burst, return the number of notifications
+
+    sock.settimeout(None)
+    sock.recvfrom(64)
+    count = 1
+    first_time = time.time()
+    while True:
+        timeout = min(quiet, first_time + max_wait - time.time())
+        if timeout <= 0:
+            return count
+        sock.settimeout(timeout)
+        try:
+            sock.recvfrom(64)
+            count += 1
+        except socket.timeout:
+            return count
+
+
+def run_daemon(config_store, spark, address=DAEMON_ADDRESS):
+
+    # process the configuration changes notified with "--notify", one run for each burst of notifications
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(address)
+    print ("Waiting for change notifications on UDP port " + str(address[1]))
+    log_cursor = load_log_cursor()
+    while True:
+        count = wait_for_changes(sock)
+        print ("Processing " + str(count) + " change notifications")
+        try:
+            log_cursor = process_changes(config_store, log_cursor, spark)
+        except Exception as error:
+            print ("Unable to process the configuration changes: " + str(error))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Post the configuration changes to a Spark room')
+    parser.add_argument('--history', action='store_true', help='list the saved config versions')
+    parser.add_argument('--diff', nargs=2, type=int, metavar='VERSION',
+                        help='compare two saved config versions, negative numbers count from the last version')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running, process the changes notified with --notify, one run for each burst')
+    parser.add_argument('--notify', action='store_true',
+                        help='notify the daemon of a change, process the change now if the daemon is not running')
+    args = parser.parse_args()
+
+    if args.notify and notify_daemon():
+        sys.exit()
+
+    config_store = ConfigStore()
+
+    if args.history:
+        for version in config_store.versions():
+            print (str(version['version']) + '  ' + version['time'] + '  ' + version['sha'])
+        sys.exit()
+
+    if args.diff:
+        print (config_store.diff(args.diff[0], args.diff[1]))
+        sys.exit()
 
-    spark_room_id = get_room_id(SPARK_ROOM)
+    spark_client = SparkClient()
 
-    post_room_message(spark_room_id, "The device with the " + device_name + " has these configuration changes:")
-    post_room_message(spark_room_id, diff)
-    post_room_message(spark_room_id, "   ")
+    if args.daemon:
+        run_daemon(config_store, spark_client)
 
-    post_room_message(spark_room_id, user_info)
+    process_changes(config_store, load_log_cursor(), spark_client)
 
     print ("End Application Run")
@@ -3,8 +3,20 @@
 
 # !/usr/bin/env python3
 
+import argparse
+import codecs
+import csv
 import requests
 import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError, wait
+from email.utils import mktime_tz, parsedate_tz
 
 import requests.packages.urllib3
 
@@ -19,6 +31,68 @@ DNAC_URL = 'https://172.28.97.211/api/v1'
 DNAC_USER = 'admin'
 DNAC_PASS = 'Cisco123'
 
+# the DNA C service ticket is renewed before this age, in seconds, or when the controller answers with 401
+
+TICKET_LIFETIME = 1800
+TICKET_REFRESH_MARGIN = 120
+
+# maximum number of keep-alive HTTPS connections to the DNA C controller
+
+DNAC_POOL_SIZE = 10
+
+# maximum age, in seconds, of the cached DNA C site hierarchy
+
+SITE_INDEX_TTL = 300
+
+# maximum number of provisioning jobs running at the same time in the bulk provisioning mode
+
+PROVISION_WORKERS = 8
+
+# number of network devices requested in each page of the DNA C network device inventory
+
+INVENTORY_PAGE_SIZE = 500
+
+# SQLite file caching the geolocation info for the site addresses
+
+GEO_CACHE_FILE = 'geo_cache.db'
+
+# DNA C task polling: the interval grows from min to max while no task completes, tasks time out after TASK_TIMEOUT,
+# more than TASK_BATCH_SIZE pending tasks are polled with one task list call
+
+TASK_POLL_MIN = 0.25
+TASK_POLL_MAX = 5
+TASK_TIMEOUT = 300
+TASK_BATCH_SIZE = 3
+
+# size of the chunks read from the DNA C responses parsed as a stream
+
+JSON_CHUNK_SIZE = 65536
+
+# local snapshot of the DNA C network device inventory: file name, number of pages fetched concurrently,
+# maximum age in seconds, and minimum time between two refreshes caused by SNs missing from the snapshot
+
+INVENTORY_SNAPSHOT_FILE = 'inventory_snapshot.json'
+INVENTORY_WORKERS = 4
+INVENTORY_MAX_AGE = 3600
+INVENTORY_MISS_REFRESH = 60
+
+# DNA C calls rate limiting: initial, minimum and maximum rate in calls per second. The rate decreases when the
+# average latency grows above DNAC_LATENCY_FACTOR times the lowest average latency observed
+
+DNAC_RATE = 10
+DNAC_MIN_RATE = 0.5
+DNAC_MAX_RATE = 50
+DNAC_LATENCY_FACTOR = 3
+
+# DNA C calls retries, for 429 responses, and for the 5xx responses and connection errors of idempotent calls,
+# with a random delay up to RETRY_BASE_DELAY * 2 ^ retry number, limited to RETRY_MAX_DELAY seconds
+
+DNAC_RETRIES = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+DNAC_TIMEOUT = 60
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
 
 def pprint(json_data):
     """
@@ -29,19 +103,21 @@ def pprint(json_data):
     print(json.dumps(json_data, indent=4, separators=(' , ', ' : ')))
 
 
-def get_service_ticket(username, password):
+def get_service_ticket(username, password, session=requests, dnac_url=DNAC_URL):
     """
     Create the authorization ticket required to access DNA C
     Call to DNA C - /ticket
     :param username: the username
     :param password: the password
+    :param session: requests session used to send the call, default a new connection
+    :param dnac_url: DNA C API base URL
     :return: ticket
     """
 
     payload = {'username': username, 'password': password}
-    url = DNAC_URL + '/ticket'
+    url = dnac_url + '/ticket'
     header = {'content-type': 'application/json'}
-    ticket_response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    ticket_response = session.post(url, data=json.dumps(payload), headers=header, verify=False)
     if not ticket_response:
         print('No data returned!')
     else:
@@ -50,12 +126,711 @@ def get_service_ticket(username, password):
         return ticket
 
 
-def create_area(area_name, ticket):
+class DNACClient(object):
+    """
+    DNA C REST API client.
+    It will keep a pool of keep-alive HTTPS connections to the controller, and it will cache the service ticket.
+    The ticket is renewed before it expires, or when the controller rejects it with a 401.
+    The client may be shared by multiple threads.
+    """
+
+    def __init__(self, dnac_url, username, password, pool_size=DNAC_POOL_SIZE):
+        """
+        :param dnac_url: DNA C API base URL
+        :param username: the username
+        :param password: the password
+        :param pool_size: maximum number of connections kept open to the controller
+        """
+        self.url = dnac_url
+        self.username = username
+        self.password = password
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({'content-type': 'application/json'})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._ticket = None
+        self._ticket_time = 0
+        self._ticket_lock = threading.Lock()
+        self.limiter = AdaptiveLimiter(max_concurrency=pool_size)
+        self.sites = SiteIndex(self)
+        self.tasks = TaskTracker(self)
+        self.inventory = InventorySnapshot(self)
+
+    def get_ticket(self):
+        """
+        Return the cached service ticket, create a new one if missing or about to expire
+        :return: ticket
+        """
+        with self._ticket_lock:
+            ticket_age = time.time() - self._ticket_time
+            if self._ticket is None or ticket_age > TICKET_LIFETIME - TICKET_REFRESH_MARGIN:
+                self._login()
+            return self._ticket
+
+    def renew_ticket(self, rejected_ticket):
+        """
+        Replace the ticket rejected by the controller. If another thread already renewed it, reuse the new one
+        :param rejected_ticket: the ticket that received a 401
+        :return: ticket
+        """
+        with self._ticket_lock:
+            if self._ticket == rejected_ticket:
+                self._login()
+            return self._ticket
+
+    def _login(self):
+        ticket = get_service_ticket(self.username, self.password, self.session, self.url)
+        if ticket is None:
+            raise RuntimeError('Unable to create a DNA C service ticket')
+        self._ticket = ticket
+        self._ticket_time = time.time()
+
+    def request(self, method, path, payload=None, **kwargs):
+        """
+        Send a call to DNA C, using the pooled connections and the cached ticket.
+        The call waits for the shared rate limiter. It is retried with a random backoff after a 429 response, and
+        after 5xx responses and connection errors if the method is idempotent. Other error responses raise HTTPError.
+        :param method: HTTP method
+        :param path: API path, relative to the DNA C API base URL
+        :param payload: optional JSON payload
+        :param kwargs: other arguments for requests
+        :return: response
+        """
+        if payload is not None:
+            kwargs['data'] = json.dumps(payload)
+        kwargs.setdefault('timeout', DNAC_TIMEOUT)
+        url = self.url + path
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry = 0
+        while True:
+            self.limiter.acquire()
+            start_time = time.time()
+            status_code = None
+            retry_after = None
+
+            # the call slot is always released, any exception counts as an error
+
+            try:
+                response = self._send(method, url, **kwargs)
+                status_code = response.status_code
+                retry_after = get_retry_after(response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not idempotent or retry == DNAC_RETRIES:
+                    raise
+                response = None
+            finally:
+                self.limiter.release(status_code, time.time() - start_time, retry_after)
+            if response is not None:
+                retriable = response.status_code == 429 or (response.status_code >= 500 and idempotent)
+                if not retriable or retry == DNAC_RETRIES:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            retry += 1
+            time.sleep(retry_after or random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** retry)))
+
+    def _send(self, method, url, **kwargs):
+        ticket = self.get_ticket()
+        response = self.session.request(method, url, headers={'X-Auth-Token': ticket}, **kwargs)
+        if response.status_code == 401:
+            ticket = self.renew_ticket(ticket)
+            response = self.session.request(method, url, headers={'X-Auth-Token': ticket}, **kwargs)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, payload, **kwargs):
+        return self.request('POST', path, payload, **kwargs)
+
+    def close(self):
+        self.inventory.save()
+        self.session.close()
+
+
+def get_retry_after(response):
+    """
+    The function will return the delay requested by the Retry-After header of the response {response}
+    :param response: HTTP response
+    :return: delay in seconds, or None
+    """
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        retry_date = parsedate_tz(retry_after)
+        if retry_date is not None:
+            return max(0.0, mktime_tz(retry_date) - time.time())
+
+
+class AdaptiveLimiter(object):
+    """
+    Rate and concurrency limiter shared by all the calls to DNA C.
+    A token bucket limits the call rate, and a counter limits the number of calls in flight.
+    Both grow slowly while the calls succeed with a steady latency, and they are reduced when DNA C answers
+    with 429 or 5xx, or when the average latency grows. A Retry-After header pauses all the calls.
+    """
+
+    def __init__(self, rate=DNAC_RATE, max_concurrency=DNAC_POOL_SIZE):
+        """
+        :param rate: initial rate, in calls per second
+        :param max_concurrency: maximum number of calls in flight
+        """
+        self.rate = float(rate)
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self._tokens = 1.0
+        self._fill_time = time.time()
+        self._in_flight = 0
+        self._paused_until = 0
+        self._latency = None
+        self._latency_floor = None
+        self._decrease_time = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait until a new call is allowed
+        :return: none
+        """
+        with self._condition:
+            while True:
+                now = time.time()
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._fill_time) * self.rate)
+                self._fill_time = now
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if self._in_flight >= int(self.concurrency):
+                        delay = None
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        self._in_flight += 1
+                        return
+                    else:
+                        delay = (1 - self._tokens) / self.rate
+                self._condition.wait(delay)
+
+    def release(self, status_code, latency, retry_after=None):
+        """
+        Record the result of a call
+        :param status_code: the response status code, None for connection errors
+        :param latency: the call latency, in seconds
+        :param retry_after: the delay requested by DNA C, in seconds
+        :return: none
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.time()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if status_code == 429:
+                self._decrease(now, 0.5)
+            elif status_code is None or status_code >= 500:
+                self._decrease(now, 0.8)
+            else:
+                self._observe(now, latency)
+            self._condition.notify_all()
+
+    def _observe(self, now, latency):
+        if self._latency is None:
+            self._latency = self._latency_floor = latency
+        self._latency = 0.8 * self._latency + 0.2 * latency
+
+        # the latency floor slowly forgets the old values, to follow the DNA C load
+
+        self._latency_floor = min(self._latency_floor * 1.01, self._latency)
+        if self._latency > DNAC_LATENCY_FACTOR * self._latency_floor:
+            self._decrease(now, 0.8)
+        else:
+            self.rate = min(DNAC_MAX_RATE, self.rate + 1 / self.rate)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def _decrease(self, now, factor):
+
+        # calls in flight usually fail together, decrease once for all of them
+
+        if now - self._decrease_time < 1:
+            return
+        self._decrease_time = now
+        self.rate = max(DNAC_MIN_RATE, self.rate * factor)
+        self.concurrency = max(1.0, self.concurrency * factor)
+
+
+class SiteIndex(object):
+    """
+    In-memory index of the DNA C site hierarchy, mapping the group names and group name hierarchies to groups.
+    The index is built from one /group call and it is reused by all lookups.
+    It is rebuilt when older than the TTL, after invalidate(), or when a lookup misses a group created since the
+    last rebuild. The created groups stay pending until a rebuild finds them, or for at most the TTL.
+    """
+
+    def __init__(self, dnac, ttl=SITE_INDEX_TTL):
+        """
+        :param dnac: DNA C client
+        :param ttl: maximum age of the index, in seconds
+        """
+        self.dnac = dnac
+        self.ttl = ttl
+        self._by_name = {}
+        self._by_hierarchy = {}
+        self._refresh_time = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Rebuild the index from the DNA C site group list
+        Call to DNA C - /group?groupType=SITE
+        :return: none
+        """
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        group_response = self.dnac.get('/group', params={'groupType': 'SITE'}, stream=True)
+        by_name = {}
+        by_hierarchy = {}
+        for group in iter_json_records(group_response):
+
+            # keep only the fields used by the lookups
+
+            group = {'id': group['id'], 'name': group['name'], 'parentId': group.get('parentId'),
+                     'groupNameHierarchy': group.get('groupNameHierarchy')}
+            by_name[group['name']] = group
+            by_hierarchy[group['groupNameHierarchy']] = group
+        self._by_name = by_name
+        self._by_hierarchy = by_hierarchy
+        self._refresh_time = time.time()
+
+        # the created groups found by this rebuild, or created too long ago, are no longer pending
+
+        self._pending = dict((name, created_time) for name, created_time in self._pending.items()
+                             if name not in by_name and name not in by_hierarchy
+                             and self._refresh_time - created_time <= self.ttl)
+
+    def invalidate(self):
+        """
+        Force a rebuild of the index on the next lookup
+        :return: none
+        """
+        with self._lock:
+            self._refresh_time = None
+
+    def group_created(self, name, hierarchy=None):
+        """
+        Called after a site group is created, the lookups of the group that miss will rebuild the index,
+        until the group is found
+        :param name: group name
+        :param hierarchy: group name hierarchy
+        :return: none
+        """
+        with self._lock:
+            created_time = time.time()
+            self._pending[name] = created_time
+            if hierarchy:
+                self._pending[hierarchy] = created_time
+
+    def get(self, name):
+        """
+        Find the site group with the name or the group name hierarchy {name}
+        :param name: group name, or group name hierarchy like Global/USA/Lake Oswego
+        :return: DNA C group, or None if not found
+        """
+        with self._lock:
+            if self._refresh_time is None or time.time() - self._refresh_time > self.ttl:
+                self._refresh()
+            group = self._lookup(name)
+            if group is None and name in self._pending:
+                self._refresh()
+                group = self._lookup(name)
+            return group
+
+    def _lookup(self, name):
+        group = self._by_hierarchy.get(name)
+        if group is None:
+            group = self._by_name.get(name)
+        return group
+
+    def get_id(self, name):
+        """
+        Find the id of the site group with the name or the group name hierarchy {name}
+        :param name: group name, or group name hierarchy
+        :return: DNA C group id, or None if not found
+        """
+        group = self.get(name)
+        if group is not None:
+            return group['id']
+
+
+class TaskTracker(object):
+    """
+    Tracker for the asynchronous DNA C tasks started by the write calls.
+    Each tracked task gets a future, completed when the task ends, or failed when the task ends with an error.
+    One background thread polls all the pending tasks: individually when there are a few, with one task list call
+    when there are many. The poll interval grows while no task completes, and it is reset when one does.
+    """
+
+    def __init__(self, dnac):
+        """
+        :param dnac: DNA C client
+        """
+        self.dnac = dnac
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._poller = None
+
+    def track(self, task_id):
+        """
+        Start tracking the task with the id {task_id}
+        :param task_id: DNA C task id
+        :return: future, its result is the DNA C task when completed
+        """
+        with self._condition:
+            if task_id in self._pending:
+                return self._pending[task_id][0]
+            future = Future()
+            self._pending[task_id] = (future, time.time())
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='dnac-task-poller')
+                self._poller.daemon = True
+                self._poller.start()
+            self._condition.notify()
+        return future
+
+    def wait(self, task_ids, timeout=None):
+        """
+        Wait for the tasks with the ids in {task_ids} to complete, all the tasks are tracked, and polled, together
+        :param task_ids: list of DNA C task ids
+        :param timeout: maximum time to wait for all the tasks, in seconds
+        :return: list of DNA C tasks, raises the error of the first failed task
+        """
+        futures = [self.track(task_id) for task_id in task_ids]
+        done, not_done = wait(futures, timeout)
+        if not_done:
+            raise TimeoutError(str(len(not_done)) + ' DNA C tasks not completed after ' + str(timeout) + ' seconds')
+        return [future.result() for future in futures]
+
+    def _poll(self):
+        interval = TASK_POLL_MIN
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._poller = None
+                    return
+                pending_count = len(self._pending)
+                self._condition.wait(interval)
+
+                # new tasks were tracked while waiting, poll them soon
+
+                if len(self._pending) > pending_count:
+                    interval = TASK_POLL_MIN
+                pending = dict(self._pending)
+            try:
+                completed = self._poll_tasks(pending)
+            except Exception as error:
+                print('\nUnable to poll the DNA C tasks: ', error)
+                completed = 0
+            interval = TASK_POLL_MIN if completed else min(interval * 2, TASK_POLL_MAX)
+
+    def _poll_tasks(self, pending):
+        tasks = {}
+
+        # a failed task list call, or task call, is reported and the timeouts are still checked, so that the
+        # futures are always completed
+
+        if len(pending) > TASK_BATCH_SIZE:
+            start_time = int((min(tracked for future, tracked in pending.values()) - 60) * 1000)
+            try:
+                task_response = self.dnac.get('/task', params={'startTime': start_time})
+                for task in task_response.json()['response']:
+                    if task['id'] in pending:
+                        tasks[task['id']] = task
+            except Exception as error:
+                print('\nUnable to poll the DNA C task list, polling the tasks one by one: ', error)
+        for task_id in pending:
+            if task_id not in tasks:
+                try:
+                    tasks[task_id] = self.dnac.get('/task/' + task_id).json()['response']
+                except Exception as error:
+                    print('\nUnable to poll the DNA C task ', task_id, ': ', error)
+
+        completed = 0
+        for task_id, (future, tracked) in pending.items():
+            task = tasks.get(task_id, {})
+            if task.get('isError'):
+                error = RuntimeError('DNA C task ' + task_id + ' failed: ' +
+                                     str(task.get('failureReason') or task.get('progress')))
+            elif task.get('endTime'):
+                error = None
+            elif time.time() - tracked > TASK_TIMEOUT:
+                error = RuntimeError('DNA C task ' + task_id + ' timed out')
+            else:
+                continue
+            with self._condition:
+                del self._pending[task_id]
+            if error is None:
+                future.set_result(task)
+            else:
+                future.set_exception(error)
+            completed += 1
+        return completed
+
+
+def get_task_id(response):
+    """
+    The function will return the id of the DNA C task started by a write call
+    :param response: DNA C response
+    :return: DNA C task id
+    """
+    try:
+        return response.json()['response']['taskId']
+    except (ValueError, KeyError, TypeError):
+        raise RuntimeError('DNA C call failed, status ' + str(response.status_code) + ': ' + response.text)
+
+
+class JSONStreamReader(object):
+    """
+    Incremental reader for a JSON document received in chunks.
+    The values are decoded one at a time, only the part of the document not yet decoded is kept in memory.
+    """
+
+    def __init__(self, chunks):
+        """
+        :param chunks: iterator of bytes chunks
+        """
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._exhausted = False
+
+    def _read(self):
+        if self._exhausted:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._exhausted = True
+            chunk = b''
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(chunk, self._exhausted)
+        self._pos = 0
+        return True
+
+    def next_char(self):
+        """
+        Skip the white space, and return the next character without consuming it
+        :return: character, or None at the end of the document
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return None
+
+    def expect(self, characters):
+        """
+        Consume the next character, it must be one of {characters}
+        :param characters: the accepted characters
+        :return: the consumed character
+        """
+        char = self.next_char()
+        if char is None or char not in characters:
+            raise ValueError('Invalid JSON, expected one of ' + characters + ', found ' + str(char))
+        self._pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode and consume the next JSON value
+        :return: the value
+        """
+        self.next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+
+                # a number at the end of the buffer may continue in the next chunk
+
+                if end < len(self._buffer) or self._exhausted:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._exhausted:
+                    raise
+            self._read()
+
+
+def iter_json_records(response, key='response'):
+    """
+    The function will parse the DNA C JSON response as a stream and yield the records in the {key} list one by one,
+    without loading the full response in memory. If the {key} value is not a list, it is the only record.
+    The response should be requested with stream=True. Stopping the iteration early closes the response.
+    :param response: DNA C response
+    :param key: top level key of the records list
+    :return: iterator of records
+    """
+    try:
+        reader = JSONStreamReader(response.iter_content(chunk_size=JSON_CHUNK_SIZE))
+        reader.expect('{')
+        if reader.next_char() == '}':
+            return
+        while True:
+            name = reader.value()
+            reader.expect(':')
+            if name != key:
+                reader.value()
+            elif reader.next_char() != '[':
+                yield reader.value()
+                return
+            else:
+                reader.expect('[')
+                if reader.next_char() == ']':
+                    return
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        return
+            if reader.expect(',}') == '}':
+                return
+    finally:
+        response.close()
+
+
+class InventorySnapshot(object):
+    """
+    Local snapshot of the DNA C network device inventory, saved to a JSON file.
+    For each device it keeps the id, SN, hostname, platform, site and last update time, and it maps the SNs to
+    the device ids, so the SN lookups do not need DNA C calls.
+    The inventory pages are fetched concurrently. On refresh, the devices with an unchanged last update time keep
+    their snapshot record, including the site.
+    """
+
+    def __init__(self, dnac, filename=INVENTORY_SNAPSHOT_FILE, max_age=INVENTORY_MAX_AGE, workers=INVENTORY_WORKERS):
+        """
+        :param dnac: DNA C client
+        :param filename: snapshot file name, None to keep the snapshot only in memory
+        :param max_age: maximum age of the snapshot, in seconds
+        :param workers: number of inventory pages fetched concurrently
+        """
+        self.dnac = dnac
+        self.filename = filename
+        self.max_age = max_age
+        self.workers = workers
+        self.devices = {}
+        self.updated = 0
+        self._serials = {}
+        self._modified = False
+        self._lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                snapshot = json.load(f)
+            self.updated = snapshot['updated']
+            self.devices = dict((device['id'], device) for device in snapshot['devices'])
+            self._index_serials()
+
+    def _index_serials(self):
+        serials = {}
+        for device in self.devices.values():
+
+            # stacks report the SNs of all the members, comma separated
+
+            for device_sn in (device.get('serialNumber') or '').split(','):
+                serials[device_sn.strip()] = device['id']
+        self._serials = serials
+
+    def save(self):
+        """
+        Save the snapshot to the snapshot file, if modified
+        :return: none
+        """
+        with self._lock:
+            if not self.filename or not self._modified:
+                return
+            snapshot = {'updated': self.updated, 'devices': list(self.devices.values())}
+            with open(self.filename + '.tmp', 'w') as f:
+                json.dump(snapshot, f)
+            os.rename(self.filename + '.tmp', self.filename)
+            self._modified = False
+
+    def _fetch_page(self, start_index):
+        device_response = self.dnac.get('/network-device/' + str(start_index) + '/' + str(INVENTORY_PAGE_SIZE),
+                                        stream=True)
+        return list(iter_json_records(device_response))
+
+    def refresh(self):
+        """
+        Refresh the snapshot from the DNA C network device inventory, fetching the pages concurrently
+        Call to DNA C - /network-device/count, /network-device/{start index}/{records to return}
+        :return: none
+        """
+        with self._lock:
+            count_response = self.dnac.get('/network-device/count')
+            device_count = count_response.json()['response']
+            start_indexes = range(1, device_count + 1, INVENTORY_PAGE_SIZE)
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pages = list(executor.map(self._fetch_page, start_indexes))
+
+            devices = {}
+            for page in pages:
+                for device in page:
+                    known_device = self.devices.get(device['id'])
+                    if known_device is not None and known_device.get('lastUpdateTime') == device.get('lastUpdateTime'):
+                        devices[device['id']] = known_device
+                        continue
+                    devices[device['id']] = {
+                        'id': device['id'],
+                        'serialNumber': device.get('serialNumber'),
+                        'hostname': device.get('hostname'),
+                        'platformId': device.get('platformId'),
+                        'lastUpdateTime': device.get('lastUpdateTime'),
+                        'site': known_device.get('site') if known_device is not None else None
+                    }
+            self.devices = devices
+            self.updated = time.time()
+            self._modified = True
+            self._index_serials()
+
+    def get_ids(self, device_sn_list):
+        """
+        The function will return the device ids for the SNs in {device_sn_list}, from the snapshot.
+        The snapshot is refreshed first if it is too old, or if some SNs are missing and it was not refreshed recently.
+        :param device_sn_list: list of network device SNs
+        :return: dict {device SN: DNA C device id}, the SNs not found in the inventory are not included
+        """
+        snapshot_age = time.time() - self.updated
+        missing = [device_sn for device_sn in device_sn_list if device_sn not in self._serials]
+        if snapshot_age > self.max_age or (missing and snapshot_age > INVENTORY_MISS_REFRESH):
+            self.refresh()
+        serials = self._serials
+        return dict((device_sn, serials[device_sn]) for device_sn in device_sn_list if device_sn in serials)
+
+    def set_site(self, device_id_list, site_name):
+        """
+        Record the site the devices with the ids in {device_id_list} are assigned to
+        :param device_id_list: list of DNA C device ids
+        :param site_name: DNA C site name
+        :return: none
+        """
+        with self._lock:
+            for device_id in device_id_list:
+                if device_id in self.devices:
+                    self.devices[device_id]['site'] = site_name
+                    self._modified = True
+
+
+def create_area(area_name, dnac):
     """
     The function will create a new area with the name {area_name}
     :param area_name: DNA C area name
-    :param ticket: DNA C ticket
-    :return: none
+    :param dnac: DNA C client
+    :return: DNA C task id
     """
     payload = {
         "additionalInfo": [
@@ -66,7 +841,7 @@ def create_area(area_name, ticket):
                 }
             }
         ],
-        "groupNameHierarchy": "Global/USA/" + area_name,
+        "groupNameHierarchy": "Global/" + area_name,
         "groupTypeList": [
             "SITE"
         ],
@@ -75,27 +850,29 @@ def create_area(area_name, ticket):
         "name": area_name,
         "id": ""
     }
-    url = DNAC_URL + '/group'
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    task_id = get_task_id(dnac.post('/group', payload))
+    dnac.sites.group_created(area_name, payload['groupNameHierarchy'])
+    return task_id
 
 
-def create_site(site_name, area_name, address, ticket):
+def create_site(site_name, area_name, address, dnac):
     """
     The function will create a new site with the name {site_name}, part of the area with the name {area_name}
     :param site_name: DNA C site name
-    :param area_name: DNA C area name
+    :param area_name: DNA C area name, or group name hierarchy
     :param address: site address
-    :param ticket: DNA C ticket
-    :return: none
+    :param dnac: DNA C client
+    :return: DNA C task id
     """
-    # get the area id for the area name
+    # get the area group for the area name, the site hierarchy is the area hierarchy and the site name
 
-    area_id = get_area_id(area_name, ticket)
+    area = dnac.sites.get(area_name)
+    if area is None:
+        raise LookupError('Area not found: ' + area_name)
 
     # get the geolocation info for address
 
-    geo_info = get_geo_info(address, GOOGLE_API_KEY)
+    geo_info = get_cached_geo_info(address)
     print('\nGeolocation info for the address ', address, ' is:')
     pprint(geo_info)
 
@@ -112,31 +889,33 @@ def create_site(site_name, area_name, address, ticket):
                 }
             }
         ],
-        "groupNameHierarchy": "Global/USA/" + site_name,
+        "groupNameHierarchy": area['groupNameHierarchy'] + '/' + site_name,
         "groupTypeList": [
             "SITE"
         ],
         "systemGroup": False,
-        "parentId": area_id,
+        "parentId": area['id'],
         "name": site_name,
         "id": ""
     }
-    url = DNAC_URL + '/group'
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    task_id = get_task_id(dnac.post('/group', payload))
+    dnac.sites.group_created(site_name, payload['groupNameHierarchy'])
+    return task_id
 
 
-def create_floor(site_name, floor_name, floor_number, ticket):
+def create_floor(site_name, floor_name, floor_number, dnac):
     """
     The function will  create a floor in the building with the name {site_name}
-    :param site_name: DNA C site name
+    :param site_name: DNA C site name, or group name hierarchy
     :param floor_name: floor name
     :param floor_number: floor number
-    :param ticket: DNA C ticket
-    :return: none
+    :param dnac: DNA C client
+    :return: DNA C task id
     """
-    # get the site id
-    site_id = get_site_id(site_name, ticket)
+    # get the site group, the floor hierarchy is the site hierarchy and the floor name
+    site = dnac.sites.get(site_name)
+    if site is None:
+        raise LookupError('Site not found: ' + site_name)
 
     payload = {
         "additionalInfo": [
@@ -164,86 +943,135 @@ def create_floor(site_name, floor_name, floor_number, ticket):
                 }
             }
         ],
-        "groupNameHierarchy": "Global/USA/Lake Oswego/" + floor_name,
+        "groupNameHierarchy": site['groupNameHierarchy'] + '/' + floor_name,
         "groupTypeList": [
             "SITE"
         ],
         "name": floor_name,
-        "parentId": site_id,
+        "parentId": site['id'],
         "systemGroup": False,
         "id": ""
     }
-    url = DNAC_URL + '/group'
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    task_id = get_task_id(dnac.post('/group', payload))
+    dnac.sites.group_created(floor_name, payload['groupNameHierarchy'])
+    return task_id
 
 
-def get_device_id(device_sn, ticket):
+def get_device_id(device_sn, dnac):
     """
     The function will return the DNA C device id for the device with serial number {device_sn}
     :param device_sn: network device SN
-    :param ticket: DNA C ticket
+    :param dnac: DNA C client
     :return: DNA C device id
     """
-    url = DNAC_URL + '/network-device/serial-number/' + device_sn
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    device_response = requests.get(url, headers=header, verify=False)
-    device_info = device_response.json()
-    device_id = device_info['response']['id']
+    device_response = dnac.get('/network-device/serial-number/' + device_sn, stream=True)
+    device_info = next(iter_json_records(device_response))
+    device_id = device_info['id']
     return device_id
 
 
-def assign_device_site(device_sn, site_name, ticket):
+def assign_device_site(device_sn, site_name, dnac):
     """
     This function will assign a device with the specified SN to a site with the name {site_name}
     :param device_sn: network device SN
     :param site_name: DNA C site name
-    :param ticket: DNA C ticket
-    :return:
+    :param dnac: DNA C client
+    :return: DNA C task id
     """
-    site_id = get_site_id(site_name, ticket)
-    device_id = get_device_id(device_sn, ticket)
-    url = DNAC_URL + '/group/' + site_id + '/member'
+    site_id = get_site_id(site_name, dnac)
+    device_id = get_device_id(device_sn, dnac)
     payload = {"networkdevice": [device_id]}
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    task_id = get_task_id(dnac.post('/group/' + site_id + '/member', payload))
     print('\nDevice with the SN: ', device_sn, 'assigned to site: ', site_name)
+    return task_id
 
 
-def get_area_id(area_name, ticket):
+def get_device_ids(device_sn_list, dnac):
+    """
+    The function will return the DNA C device ids for all the devices with the serial numbers in {device_sn_list}.
+    The SNs are resolved from the local snapshot of the network device inventory, refreshed when needed.
+    :param device_sn_list: list of network device SNs
+    :param dnac: DNA C client
+    :return: dict {device SN: DNA C device id}, the SNs not found in the inventory are not included
+    """
+    return dnac.inventory.get_ids(device_sn_list)
+
+
+def assign_devices_site(device_id_list, site_name, dnac):
+    """
+    This function will assign all the devices with the ids in {device_id_list} to the site {site_name},
+    with one DNA C call
+    :param device_id_list: list of DNA C device ids
+    :param site_name: DNA C site name, or group name hierarchy
+    :param dnac: DNA C client
+    :return: DNA C task id
+    """
+    site_id = get_site_id(site_name, dnac)
+    if site_id is None:
+        raise LookupError('Site not found: ' + site_name)
+    payload = {"networkdevice": list(device_id_list)}
+    task_id = get_task_id(dnac.post('/group/' + site_id + '/member', payload))
+    print('\n', len(device_id_list), ' devices assigned to site: ', site_name)
+    return task_id
+
+
+def assign_devices_sites(assignments, dnac):
+    """
+    This function will assign many devices to sites. All the device SNs are resolved with one inventory fetch,
+    and the devices are assigned with one DNA C call per site. It returns after all the DNA C tasks completed.
+    :param assignments: list of (device SN, site name)
+    :param dnac: DNA C client
+    :return: list of the device SNs not found in the DNA C inventory
+    """
+    device_ids = get_device_ids([device_sn for device_sn, site_name in assignments], dnac)
+    site_devices = {}
+    not_found = []
+    for device_sn, site_name in assignments:
+        if device_sn in device_ids:
+            site_devices.setdefault(site_name, []).append(device_ids[device_sn])
+        else:
+            not_found.append(device_sn)
+    task_ids = [assign_devices_site(device_id_list, site_name, dnac)
+                for site_name, device_id_list in site_devices.items()]
+    dnac.tasks.wait(task_ids)
+    for site_name, device_id_list in site_devices.items():
+        dnac.inventory.set_site(device_id_list, site_name)
+    return not_found
+
+
+def get_site_device_ids(site_id, dnac):
+    """
+    The function will return the ids of the devices assigned to the site with the id {site_id}
+    Call to DNA C - /group/{site id}/member?memberType=networkdevice
+    :param site_id: DNA C site id
+    :param dnac: DNA C client
+    :return: set of DNA C device ids
+    """
+    member_response = dnac.get('/group/' + site_id + '/member', params={'memberType': 'networkdevice'})
+    member_list = member_response.json()['response']
+    if isinstance(member_list, dict):
+        member_list = member_list.get('networkdevice', [])
+    return set(device['id'] for device in member_list)
+
+
+def get_area_id(area_name, dnac):
     """
     The function will return the DNA C area id for the area with the name {area_name}
     :param area_name: DNA C area name
-    :param ticket: DNA C ticket
+    :param dnac: DNA C client
     :return: DNA C area id
     """
-    url = DNAC_URL + '/group?groupType=SITE'
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    area_response = requests.get(url, headers=header, verify=False)
-    area_json = area_response.json()
-    area_list = area_json['response']
-    for area in area_list:
-        if area_name == area['name']:
-            area_id = area['id']
-    return area_id
+    return dnac.sites.get_id(area_name)
 
 
-def get_site_id(site_name, ticket):
+def get_site_id(site_name, dnac):
     """
     The function will get the DNA C site id for the site with the name {site_name}
     :param site_name: DNA C site name
-    :param ticket: DNA C ticket
+    :param dnac: DNA C client
     :return: DNA C site id
     """
-    url = DNAC_URL + '/group?groupType=SITE'
-    header = {'content-type': 'application/json', 'X-Auth-Token': ticket}
-    site_response = requests.get(url, headers=header, verify=False)
-    site_json = site_response.json()
-    site_list = site_json['response']
-    for site in site_list:
-        if site_name == site['name']:
-            site_id = site['id']
-    return site_id
+    return dnac.sites.get_id(site_name)
 
 
 def get_geo_info(address, google_key):
@@ -253,14 +1081,397 @@ def get_geo_info(address, google_key):
     :param google_key: Google API Key
     :return: longitude/latitude
     """
-    url = 'https://maps.googleapis.com/maps/api/geocode/json?address=' + address + '&key=' + google_key
+    url = 'https://maps.googleapis.com/maps/api/geocode/json'
     header = {'content-type': 'application/json'}
-    response = requests.get(url, headers=header, verify=False)
+    response = requests.get(url, params={'address': address, 'key': google_key}, headers=header, verify=False)
     response_json = response.json()
     location_info = response_json['results'][0]['geometry']['location']
     return location_info
 
 
+def normalize_address(address):
+    """
+    The function will normalize the address, used as the geolocation cache key: lower case, single spaces
+    :param address: address
+    :return: normalized address
+    """
+    address = re.sub(r'\s+', ' ', address.strip().lower())
+    return re.sub(r'\s*,\s*', ', ', address)
+
+
+class GeoCache(object):
+    """
+    Persistent cache of the geolocation info for addresses, stored in a SQLite file and keyed on the
+    normalized address. Concurrent lookups for the same address share one Google API call.
+    In offline mode the addresses are only looked up in the cache.
+    """
+
+    def __init__(self, filename=GEO_CACHE_FILE, google_key=GOOGLE_API_KEY, offline=False):
+        """
+        :param filename: SQLite file name
+        :param google_key: Google API Key
+        :param offline: if True, never call the Google API
+        """
+        self.google_key = google_key
+        self.offline = offline
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS geo_info '
+                         '(address TEXT PRIMARY KEY, lat REAL, lng REAL, updated REAL)')
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def get(self, address):
+        """
+        The function will return the longitude/latitude for the address {address}, from the cache if available
+        :param address: address, including ZIP and Country
+        :return: longitude/latitude
+        """
+        key = normalize_address(address)
+        with self._lock:
+            row = self._db.execute('SELECT lat, lng FROM geo_info WHERE address = ?', (key,)).fetchone()
+            if row is not None:
+                return {'lat': row[0], 'lng': row[1]}
+            if self.offline:
+                raise LookupError('Address not found in the geolocation cache: ' + address)
+            future = self._in_flight.get(key)
+            if future is not None:
+                lookup_owner = False
+            else:
+                lookup_owner = True
+                future = Future()
+                self._in_flight[key] = future
+
+        # only one thread calls the Google API for an address, the others wait for its result
+
+        if not lookup_owner:
+            return future.result()
+        try:
+            geo_info = get_geo_info(address, self.google_key)
+        except Exception as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO geo_info VALUES (?, ?, ?, ?)',
+                             (key, geo_info['lat'], geo_info['lng'], time.time()))
+            self._db.commit()
+            del self._in_flight[key]
+        future.set_result(geo_info)
+        return geo_info
+
+    def close(self):
+        self._db.close()
+
+
+geo_cache = None  # the GeoCache used by create_site, created on first use
+_geo_cache_lock = threading.Lock()
+
+
+def get_cached_geo_info(address):
+    """
+    The function will find the longitude/latitude for the address {address}, using the geolocation cache
+    :param address: address, including ZIP and Country
+    :return: longitude/latitude
+    """
+    global geo_cache
+    with _geo_cache_lock:
+        if geo_cache is None:
+            geo_cache = GeoCache()
+    return geo_cache.get(address)
+
+
+def load_inventory(filename):
+    """
+    The function will load the provisioning inventory from a CSV or YAML file.
+    Each record has a type (area, site, floor or device), a name, and the name of the parent it belongs to.
+    Sites also have an address, floors a floor_number. For devices the name is the device SN, and the parent
+    is the site or the floor the device will be assigned to. The parent may also be a group name hierarchy,
+    like Lake Oswego/Floor 3, when the name alone is ambiguous.
+    CSV files have the header: type,name,parent,address,floor_number
+    YAML files have a list of records with the same keys, optionally under an "inventory" key.
+    :param filename: inventory file name, .csv, .yml or .yaml
+    :return: list of inventory records
+    """
+    if filename.endswith(('.yml', '.yaml')):
+        import yaml  # only required for YAML inventories
+        with open(filename) as f:
+            inventory_data = yaml.safe_load(f)
+        if isinstance(inventory_data, dict):
+            inventory_data = inventory_data['inventory']
+    else:
+        with open(filename) as f:
+            inventory_data = list(csv.DictReader(f))
+    inventory = []
+    for record in inventory_data:
+        record = {key.strip(): (str(value).strip() if value is not None else '') for key, value in record.items()}
+        if record.get('type') not in ('area', 'site', 'floor', 'device'):
+            raise ValueError('Unknown inventory record type: ' + str(record.get('type')))
+        inventory.append(record)
+    return inventory
+
+
+def add_inventory_paths(inventory, dnac):
+    """
+    The function will add to the inventory records their group name hierarchy, "path", and the group name
+    hierarchy of their parent, "parent_path". The parent is the inventory record with the name, or with the group
+    name hierarchy ending with, the record parent, or an existing DNA C group. The records with paths are unchanged.
+    :param inventory: list of inventory records, see load_inventory
+    :param dnac: DNA C client
+    :return: list of the inventory records with paths, the device records have only a parent path
+    """
+    groups = {}
+    for record in inventory:
+        if record['type'] != 'device':
+            groups.setdefault(record['name'], []).append(record)
+    paths = {}
+
+    def get_path(record, ancestors=()):
+        if id(record) not in paths:
+            if id(record) in ancestors:
+                raise ValueError('Inventory cycle at the ' + record['type'] + ' ' + record['name'])
+            if 'path' in record:
+                paths[id(record)] = record['path']
+            else:
+                parent_path = get_parent_path(record.get('parent'), ancestors + (id(record),))
+                paths[id(record)] = parent_path + '/' + record['name']
+        return paths[id(record)]
+
+    def get_parent_path(parent, ancestors=()):
+        if not parent:
+            return 'Global'
+        matches = [path for path in (get_path(group, ancestors) for group in groups.get(parent.split('/')[-1], []))
+                   if path == parent or path.endswith('/' + parent)]
+        if len(matches) > 1:
+            raise ValueError('Ambiguous inventory parent: ' + parent + ', use one of ' + ', '.join(matches))
+        if matches:
+            return matches[0]
+
+        # not part of the inventory, the parent is looked up when the record is provisioned if not found now
+
+        group = dnac.sites.get(parent)
+        return group['groupNameHierarchy'] if group is not None else parent
+
+    inventory_paths = []
+    for record in inventory:
+        path = get_path(record) if record['type'] != 'device' else None
+        record = dict(record, parent_path=record.get('parent_path') or get_parent_path(record.get('parent')))
+        if path is not None:
+            record['path'] = path
+        inventory_paths.append(record)
+    return inventory_paths
+
+
+def run_dependency_graph(jobs, max_workers=PROVISION_WORKERS):
+    """
+    The function will run the jobs in a dependency graph. A job starts as soon as all the jobs it depends on
+    completed successfully, independent jobs run concurrently in a bounded pool of worker threads.
+    A job may return a future, for example for a DNA C task, it is then completed when the future is done,
+    without holding a worker thread. The jobs depending on a failed job are skipped.
+    :param jobs: dict {job key: (function with no arguments, list of the job keys it depends on)}
+    :param max_workers: maximum number of jobs running at the same time
+    :return: dict {job key: exception} for the failed and the skipped jobs
+    """
+    waiting = {}
+    dependents = {key: [] for key in jobs}
+    for key, (function, depends_on) in jobs.items():
+        waiting[key] = set(dep for dep in depends_on if dep in jobs)
+        for dep in waiting[key]:
+            dependents[dep].append(key)
+
+    failed = {}
+
+    def skip(key, error):
+        for dependent in dependents[key]:
+            if dependent in waiting:
+                del waiting[dependent]
+                failed[dependent] = error
+                skip(dependent, error)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+
+        def start_ready():
+            for key in [key for key, depends_on in waiting.items() if not depends_on]:
+                del waiting[key]
+                running[executor.submit(jobs[key][0])] = key
+
+        start_ready()
+        while running:
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                error = future.exception()
+                if error is None and isinstance(future.result(), Future):
+                    running[future.result()] = key
+                    continue
+                if error is not None:
+                    failed[key] = error
+                    skip(key, RuntimeError('Skipped, ' + str(key) + ' failed: ' + str(error)))
+                else:
+                    for dependent in dependents[key]:
+                        if dependent in waiting:
+                            waiting[dependent].discard(key)
+            start_ready()
+
+    # what is left is part of a dependency cycle
+
+    for key in waiting:
+        failed[key] = RuntimeError('Dependency cycle, not started')
+    return failed
+
+
+def provision_inventory(inventory, dnac, max_workers=PROVISION_WORKERS):
+    """
+    The function will provision the inventory records: create the areas, sites and floors and assign
+    the devices to sites. Each record depends on its parent, if the parent is part of the inventory.
+    Independent branches of the area -> site -> floor -> device hierarchy are provisioned concurrently.
+    The records are identified by their group name hierarchy, so groups with the same name in different
+    parents are provisioned separately.
+    :param inventory: list of inventory records, see load_inventory
+    :param dnac: DNA C client
+    :param max_workers: maximum number of DNA C jobs running at the same time
+    :return: dict {(record type, record group name hierarchy or device SN): exception} for the records that were
+    not provisioned
+    """
+    inventory = add_inventory_paths(inventory, dnac)
+    record_keys = {}
+    for record in inventory:
+        if record['type'] != 'device':
+            record_keys[record['path']] = (record['type'], record['path'])
+
+    jobs = {}
+    failed = {}
+    site_devices = {}
+    for record in inventory:
+        if record['type'] == 'device':
+            site_devices.setdefault(record['parent_path'], []).append(record['name'])
+            continue
+        key = (record['type'], record['path'])
+        depends_on = [record_keys[record['parent_path']]] if record['parent_path'] in record_keys else []
+        jobs[key] = (provision_job(record, dnac), depends_on)
+
+    # resolve all the device SNs at once, the devices are assigned with one job per site
+
+    if site_devices:
+        device_ids = dict((record['name'], record['device_id']) for record in inventory if record.get('device_id'))
+        unresolved = [sn for sn_list in site_devices.values() for sn in sn_list if sn not in device_ids]
+        if unresolved:
+            device_ids.update(get_device_ids(unresolved, dnac))
+        for site_path, sn_list in site_devices.items():
+            for device_sn in sn_list:
+                if device_sn not in device_ids:
+                    failed[('device', device_sn)] = LookupError('Device not found in the DNA C inventory')
+            device_id_list = [device_ids[device_sn] for device_sn in sn_list if device_sn in device_ids]
+            if device_id_list:
+                depends_on = [record_keys[site_path]] if site_path in record_keys else []
+                jobs[('devices', site_path)] = (assign_devices_job(device_id_list, site_path, dnac), depends_on)
+
+    failed.update(run_dependency_graph(jobs, max_workers))
+    for key, error in failed.items():
+        print('\nUnable to provision the', key[0], key[1], ':', error)
+    return failed
+
+
+def plan_inventory(inventory, dnac, max_workers=PROVISION_WORKERS):
+    """
+    The function will compare the inventory with the current DNA C state and return the records that are missing.
+    The site hierarchy is fetched once, the device SNs are resolved with one inventory fetch, and the
+    device memberships are fetched once for each existing site with devices in the inventory.
+    :param inventory: list of inventory records, see load_inventory
+    :param dnac: DNA C client
+    :param max_workers: maximum number of DNA C calls running at the same time
+    :return: list of the inventory records to provision, with their group name hierarchies,
+    the device records include the DNA C device id
+    """
+    dnac.sites.refresh()
+    plan = []
+    site_devices = {}
+    for record in add_inventory_paths(inventory, dnac):
+        if record['type'] == 'device':
+            site_devices.setdefault(record['parent_path'], []).append(record['name'])
+            continue
+
+        # compared by group name hierarchy, a group with the same name in another parent is not a match
+
+        if dnac.sites.get(record['path']) is None:
+            plan.append(record)
+    if not site_devices:
+        return plan
+
+    # snapshot the device memberships of the existing sites
+
+    device_ids = get_device_ids([sn for sn_list in site_devices.values() for sn in sn_list], dnac)
+    site_ids = dict((site_path, dnac.sites.get_id(site_path)) for site_path in site_devices)
+    existing_site_ids = [site_id for site_id in site_ids.values() if site_id is not None]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        members = dict(zip(existing_site_ids,
+                           executor.map(lambda site_id: get_site_device_ids(site_id, dnac), existing_site_ids)))
+
+    for site_path, sn_list in site_devices.items():
+        site_members = members.get(site_ids[site_path], set())
+        dnac.inventory.set_site(site_members, site_path)
+        for device_sn in sn_list:
+            device_id = device_ids.get(device_sn)
+            if device_id is None or device_id not in site_members:
+                plan.append({'type': 'device', 'name': device_sn, 'parent': site_path, 'parent_path': site_path,
+                             'device_id': device_id})
+    return plan
+
+
+def print_plan(plan):
+    """
+    The function will print the provisioning plan
+    :param plan: list of the inventory records to provision, see plan_inventory
+    :return: none
+    """
+    if not plan:
+        print('\nDNA C is up to date with the inventory, nothing to provision')
+        return
+    print('\nProvisioning plan, ', len(plan), ' changes:')
+    for record in plan:
+        if record['type'] == 'device':
+            print('    assign device', record['name'], 'to', record['parent'])
+        else:
+            print('    create', record['type'], record['name'], 'in', record.get('parent_path') or 'Global')
+
+
+def provision_job(record, dnac):
+    """
+    The function will return the DNA C provisioning job for the area, site or floor inventory record {record}
+    :param record: inventory record, with the parent group name hierarchy, see add_inventory_paths
+    :param dnac: DNA C client
+    :return: function with no arguments
+    """
+    record_type = record['type']
+    if record_type == 'area':
+        return lambda: dnac.tasks.track(create_area(record['name'], dnac))
+    if record_type == 'site':
+        return lambda: dnac.tasks.track(create_site(record['name'], record['parent_path'], record['address'], dnac))
+    return lambda: dnac.tasks.track(create_floor(record['parent_path'], record['name'], int(record['floor_number']),
+                                                 dnac))
+
+
+def assign_devices_job(device_id_list, site_name, dnac):
+    """
+    The function will return the DNA C job assigning the devices {device_id_list} to the site {site_name}
+    :param device_id_list: list of DNA C device ids
+    :param site_name: DNA C site name, or group name hierarchy
+    :param dnac: DNA C client
+    :return: function with no arguments
+    """
+    def record_site(task):
+        if task.exception() is None:
+            dnac.inventory.set_site(device_id_list, site_name)
+
+    def job():
+        task = dnac.tasks.track(assign_devices_site(device_id_list, site_name, dnac))
+        task.add_done_callback(record_site)
+        return task
+    return job
+
+
 def main():
     """
     This application will use the DNA Center REST APIs to create two new areas, three new sites, one floor.
@@ -268,48 +1479,88 @@ def main():
     by DNA Center during the configuration of new sites.
     It will continue by assigning devices based on the Serial Numbers to each of these sites.
     All the data required by this sample code could be easily imported from a CSV file.
+    When started with an inventory file, it will provision all the inventory records instead, see load_inventory.
     """
 
-    # create a DNA C ticket
+    parser = argparse.ArgumentParser(description='DNA Center sites provisioning')
+    parser.add_argument('inventory', nargs='?', help='CSV or YAML inventory file for bulk provisioning')
+    parser.add_argument('--workers', type=int, default=PROVISION_WORKERS,
+                        help='maximum number of concurrent provisioning jobs')
+    parser.add_argument('--plan', action='store_true',
+                        help='only print the changes required to provision the inventory, do not apply them')
+    parser.add_argument('--inventory-snapshot', default=INVENTORY_SNAPSHOT_FILE,
+                        help='local snapshot of the DNA C network device inventory')
+    parser.add_argument('--geo-cache', default=GEO_CACHE_FILE, help='geolocation cache file')
+    parser.add_argument('--geo-offline', action='store_true',
+                        help='use only the geolocation cache, do not call the Google API')
+    args = parser.parse_args()
+
+    global geo_cache
+    geo_cache = GeoCache(args.geo_cache, offline=args.geo_offline)
+
+    # create the DNA C client, it will create and renew the DNA C ticket as needed
+
+    dnac = DNACClient(DNAC_URL, DNAC_USER, DNAC_PASS, pool_size=max(DNAC_POOL_SIZE, args.workers))
+    dnac.inventory = InventorySnapshot(dnac, args.inventory_snapshot, workers=min(INVENTORY_WORKERS, args.workers))
+    print('\nDNA Center ticket: ', dnac.get_ticket())
 
-    dnac_ticket = get_service_ticket(DNAC_USER, DNAC_PASS)
-    print('\nDNA Center ticket: ', dnac_ticket)
+    if args.inventory:
+
+        # bulk provisioning mode, only the inventory records missing from DNA C are provisioned
+
+        inventory = load_inventory(args.inventory)
+        print('\nLoaded ', len(inventory), ' inventory records from ', args.inventory)
+        plan = plan_inventory(inventory, dnac, args.workers)
+        print_plan(plan)
+        if plan and not args.plan:
+            provision_inventory(plan, dnac, args.workers)
+        dnac.close()
+        print('\n\nEnd of application run')
+        return
 
     # create the DNA C areas
 
     area_us = 'USA'
-    create_area(area_us, dnac_ticket)
+    area_us_task = create_area(area_us, dnac)
 
     area_eur = 'EUROPE'
-    create_area(area_eur, dnac_ticket)
+    area_eur_task = create_area(area_eur, dnac)
+
+    # wait for DNA C to create the areas
+
+    dnac.tasks.wait([area_us_task, area_eur_task])
 
     # get the DNA C area ids
 
-    area_us_id = get_area_id(area_us, dnac_ticket)
+    area_us_id = get_area_id(area_us, dnac)
     print('\nDNA C Area Id for USA is: ', area_us_id)
 
-    area_eur_id = get_area_id(area_eur, dnac_ticket)
+    area_eur_id = get_area_id(area_eur, dnac)
     print('\nDNA C Area Id for EUROPE is: ', area_eur_id)
 
     # create the DNA C sites
 
     site_usa_or = 'Lake Oswego'
     site_add_usa_or = '5400 SW Meadows Rd, Lake Oswego, Oregon 97035, United States'
-    create_site(site_usa_or, area_us, site_add_usa_or, dnac_ticket)
+    site_usa_or_task = create_site(site_usa_or, area_us, site_add_usa_or, dnac)
 
     site_usa_ca = 'San Jose'
     site_add_usa_ca = '725 Alder Dr, Milpitas, CA 95035, United States'
-    create_site(site_usa_ca, area_us, site_add_usa_ca, dnac_ticket)
+    site_usa_ca_task = create_site(site_usa_ca, area_us, site_add_usa_ca, dnac)
 
     site_eur_ned = 'Amsterdam'
     site_add_eur_ned = 'Haarlerbergweg 15, 1101 CH Amsterdam-Zuidoost, Netherlands'
-    create_site(site_eur_ned, area_eur, site_add_eur_ned, dnac_ticket)
+    site_eur_ned_task = create_site(site_eur_ned, area_eur, site_add_eur_ned, dnac)
+
+    # wait for DNA C to create the sites
+
+    dnac.tasks.wait([site_usa_or_task, site_usa_ca_task, site_eur_ned_task])
 
     # create a new DNA C floor
 
     floor_usa_or = 'Floor 3'
     floor_number = 3
-    create_floor(site_usa_or, floor_usa_or, floor_number, dnac_ticket)
+    dnac.tasks.wait([create_floor(site_usa_or, floor_usa_or, floor_number, dnac)])
 
     # assign devices to sites
 
@@ -319,11 +1570,13 @@ def main():
     sn_2900_1 = 'FTX1840ALC1'
     sn_2900_2 = 'FTX1840ALBY'
 
-    assign_device_site(sn_9300, site_usa_or, dnac_ticket)
-    assign_device_site(sn_3650, site_usa_or, dnac_ticket)
-    assign_device_site(sn_2960, site_usa_ca, dnac_ticket)
-    assign_device_site(sn_2900_1, site_usa_ca, dnac_ticket)
-    assign_device_site(sn_2900_2, site_usa_ca, dnac_ticket)
+    assignments = [(sn_9300, site_usa_or), (sn_3650, site_usa_or), (sn_2960, site_usa_ca),
+                   (sn_2900_1, site_usa_ca), (sn_2900_2, site_usa_ca)]
+    not_found = assign_devices_sites(assignments, dnac)
+    for device_sn in not_found:
+        print('\nDevice with the SN: ', device_sn, ' not found in the DNA C inventory')
+
+    dnac.close()
 
     print('\n\nEnd of application run')
 
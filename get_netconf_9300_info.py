@@ -4,16 +4,29 @@
 # !/usr/bin/env python3
 
 
+import argparse
+import array
+import collections
+import csv
+import heapq
+import math
+import random
 import select
+import socket
 import sys
+import threading
 import time
-import xml.dom.minidom
+import xml.etree.ElementTree as ET
 
 import requests
 import requests.packages.urllib3
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 from ncclient import manager
+from ncclient.operations.errors import TimeoutExpiredError
+from ncclient.transport.errors import TransportError
+from ncclient.xml_ import to_ele
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
-from twython import Twython
+from twython import Twython, TwythonAuthError, TwythonError, TwythonRateLimitError
 
 from twitter_init import APP_KEY, APP_SECRET, OAUTH_TOKEN, OAUTH_TOKEN_SECRET
 
@@ -32,144 +45,1046 @@ PORT = 830
 USER = 'cisco'
 PASS = 'cisco'
 
+# YANG namespaces
 
-def get_hostname():
+IETF_INTERFACES_NS = 'urn:ietf:params:xml:ns:yang:ietf-interfaces'
+IETF_IP_NS = 'urn:ietf:params:xml:ns:yang:ietf-ip'
+IOS_XE_NATIVE_NS = 'http://cisco.com/ns/yang/Cisco-IOS-XE-native'
+IOS_XE_ENVIRONMENT_NS = 'http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper'
+EVENT_NOTIFICATIONS_NS = 'urn:ietf:params:xml:ns:yang:ietf-event-notifications'
+YANG_PUSH_NS = 'urn:ietf:params:xml:ns:yang:ietf-yang-push'
+NETCONF_NOTIFICATIONS_NS = 'urn:ietf:params:xml:ns:yang:ietf-netconf-notifications'
+
+# prefixes used by the XML paths
+
+NAMESPACES = {'if': IETF_INTERFACES_NS, 'ip': IETF_IP_NS, 'ios': IOS_XE_NATIVE_NS, 'env': IOS_XE_ENVIRONMENT_NS,
+              'notif': EVENT_NOTIFICATIONS_NS, 'yp': YANG_PUSH_NS, 'ncn': NETCONF_NOTIFICATIONS_NS}
+
+# size of the chunks fed to the streaming XML parser
+
+XML_CHUNK_SIZE = 65536
+
+# NETCONF RPC timeout, in seconds
+
+RPC_TIMEOUT = 30
+
+
+class NetconfPool(object):
+    """
+    Pool of persistent NETCONF sessions, one session for each device, shared by all the query functions.
+    The sessions are kept open between the RPCs, a session found closed is reconnected before it is used,
+    and an RPC failing because the session broke is retried once on a new session.
+    The RPCs to a device are sent one at a time, the RPCs to different devices may run concurrently.
+    A thread may set a deadline, see set_deadline, its RPCs then get only the time left before the deadline.
+    """
+
+    def __init__(self, port=PORT, username=USER, password=PASS, timeout=RPC_TIMEOUT):
+        """
+        :param port: default NETCONF port
+        :param username: default username
+        :param password: default password
+        :param timeout: RPC timeout, in seconds
+        """
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._devices = {}
+        self._sessions = {}
+        self._device_locks = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def set_deadline(self, deadline):
+        """
+        Set the deadline of the RPCs sent by the current thread, the RPCs started after the deadline fail
+        :param deadline: deadline, in seconds since the epoch, none to use only the RPC timeout
+        :return: none
+        """
+        self._local.deadline = deadline
+
+    def get_timeout(self):
+        """
+        :return: the RPC timeout of the current thread, in seconds, limited to the time left before its deadline,
+        raises TimeoutExpiredError after the deadline
+        """
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutExpiredError('Deadline exceeded')
+        return min(self.timeout, remaining)
+
+    def add_device(self, host, port=None, username=None, password=None):
+        """
+        Set the NETCONF port and the user credentials for the device {host}, if different from the pool defaults
+        :param host: device IP address or hostname
+        :param port: NETCONF port
+        :param username: username
+        :param password: password
+        :return: none
+        """
+        self._devices[host] = {'port': port or self.port, 'username': username or self.username,
+                               'password': password or self.password}
+
+    def _device_lock(self, host):
+        with self._lock:
+            if host not in self._device_locks:
+                self._device_locks[host] = threading.Lock()
+            return self._device_locks[host]
+
+    def connect(self, host, timeout=None):
+        """
+        Open a new NETCONF session to the device {host}, not managed by the pool.
+        The session is opened by another thread, so the wait is bounded by {timeout} even when the device
+        is slow to send its SSH banner, a session opened after the timeout is closed.
+        :param host: device IP address or hostname
+        :param timeout: connection and RPC timeout, in seconds, default the pool RPC timeout
+        :return: ncclient manager
+        """
+        timeout = timeout or self.timeout
+        connection = Future()
+
+        def run():
+            try:
+                connection.set_result(self._connect(host, timeout))
+            except Exception as error:
+                connection.set_exception(error)
+
+        def close(done):
+            if done.exception() is None:
+                try:
+                    done.result().close_session()
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=run, name='netconf-connect-' + host)
+        thread.daemon = True
+        thread.start()
+        try:
+            return connection.result(timeout)
+        except TimeoutError:
+            connection.add_done_callback(close)
+            raise TimeoutExpiredError('NETCONF connection to ' + host + ' timed out')
+
+    def _connect(self, host, timeout):
+        device = self._devices.get(host, {'port': self.port, 'username': self.username, 'password': self.password})
+        session = manager.connect(host=host, port=device['port'], username=device['username'],
+                                  password=device['password'], hostkey_verify=False,
+                                  device_params={'name': 'default'},
+                                  allow_agent=False, look_for_keys=False, timeout=timeout)
+        session.timeout = timeout
+        return session
+
+    def _session(self, host, timeout):
+        session = self._sessions.get(host)
+        if session is None or not session.connected:
+            session = self.connect(host, timeout)
+            self._sessions[host] = session
+        return session
+
+    def _drop(self, host):
+        session = self._sessions.pop(host, None)
+        if session is not None:
+            try:
+                session.close_session()
+            except Exception:
+                pass
+
+    def rpc(self, host, operation, *args, **kwargs):
+        """
+        Send the NETCONF operation {operation} to the device {host}, using the pooled session
+        :param host: device IP address or hostname
+        :param operation: ncclient manager operation name, like get or get_config
+        :param args: operation arguments
+        :param kwargs: operation keyword arguments
+        :return: the RPC reply
+        """
+        with self._device_lock(host):
+            retry = True
+            while True:
+                timeout = self.get_timeout()
+                session = self._session(host, timeout)
+                session.timeout = timeout
+                try:
+                    return getattr(session, operation)(*args, **kwargs)
+                except (TransportError, TimeoutExpiredError, socket.error):
+
+                    # the session is broken or out of sync, replace it
+
+                    self._drop(host)
+                    if not retry:
+                        raise
+                    retry = False
+
+    def close(self):
+        """
+        Close all the pooled sessions
+        :return: none
+        """
+        for host in list(self._sessions):
+            with self._device_lock(host):
+                self._drop(host)
+
+
+# fleet polling: sample interval in seconds, maximum number of devices polled at the same time, and the random
+# delay added to each poll, as a fraction of the interval
+
+FLEET_INTERVAL = 10
+FLEET_WORKERS = 64
+FLEET_JITTER = 0.1
+
+# default temperature threshold, in Celsius
+
+TEMP_THRESHOLD = 46
+
+# inlet air temperature sensor, sensor 0 - inlet temperature, sensor 2 - switch temperature
+
+INLET_SENSOR = 'Temp Sensor 0'
+
+# number of samples kept for each sensor, and number of recent samples averaged by the threshold checks
+
+SENSOR_HISTORY = 360
+SMOOTHING_WINDOW = 6
+
+# YANG push subscriptions: the sensors update period, and the interface state dampening period, in centiseconds,
+# and the time to wait for a notification before checking the subscription session, in seconds
+
+SUBSCRIPTION_PERIOD = 100
+SUBSCRIPTION_DAMPENING = 0
+NOTIFICATION_WAIT = 30
+
+# configuration cache: time the hostname and interface IPs are reused when the device reports its configuration
+# changes, and when it does not, in seconds
+
+CONFIG_CACHE_TTL = 3600
+CONFIG_CACHE_UNWATCHED_TTL = 300
+
+# delay before subscribing again to the configuration changes of a device where the subscription failed, doubled
+# after each failure, up to the maximum, in seconds
+
+CONFIG_WATCH_RETRY_DELAY = 300
+CONFIG_WATCH_RETRY_MAX_DELAY = 3600
+
+# Twitter alerts: maximum number of status updates in the rate limit period (in seconds), maximum number of alerts
+# waiting to be sent, number of retries and the retry delays, in seconds, and the time to wait for the pending
+# alerts when the application ends
+
+ALERT_RATE = 300
+ALERT_RATE_PERIOD = 10800
+ALERT_BACKLOG = 100
+ALERT_RETRIES = 4
+ALERT_RETRY_DELAY = 2
+ALERT_RETRY_MAX_DELAY = 120
+ALERT_FLUSH_TIMEOUT = 30
+
+# GPS coordinates of the office where the switch is located, Lake Oswego, OR
+
+OFFICE_LOCATION = (45.4176, -122.7331)
+
+# outside temperature cache: time the forecast is reused before it is revalidated with weather.gov, and the time to
+# wait for weather.gov when an expired forecast can be used instead, in seconds
+
+WEATHER_TTL = 900
+WEATHER_TIMEOUT = 5
+
+# weather.gov request timeout, in seconds, a hung request would otherwise block the callers with no cached forecast
+
+WEATHER_REQUEST_TIMEOUT = 30
+
+
+# NETCONF sessions shared by the query functions
+
+netconf_pool = NetconfPool()
+
+
+class XmlPath(object):
     """
-    This function will retrieve the switch configured hostname using NETCONF.
+    Precompiled, namespace aware XML path, like "if:interfaces-state/if:interface", or "." for the element itself.
+    The path is matched against the end of the element path, so it selects the same elements in an <rpc-reply>
+    and in a <notification>, and it only matches the elements with the right names and namespaces.
+    """
+
+    def __init__(self, path, namespaces=NAMESPACES):
+        """
+        :param path: XML path, the elements names with their namespace prefix, separated by "/"
+        :param namespaces: dict {prefix: namespace}
+        """
+        self.path = path
+        tags = []
+        if path != '.':
+            for step in path.split('/'):
+                prefix, name = step.split(':')
+                tags.append('{' + namespaces[prefix] + '}' + name)
+        self.tags = tuple(tags)
+
+    def matches(self, tags):
+        """
+        :param tags: the tags of the element and of all its ancestors, from the root
+        :return: True if the element path ends with this path
+        """
+        return len(tags) >= len(self.tags) and tuple(tags[len(tags) - len(self.tags):]) == self.tags
+
+
+def extract_records(reply_xml, selectors):
+    """
+    This function will parse the NETCONF reply as a stream, and yield a record for each element selected.
+    The parsed elements are discarded as soon as they are processed, so large replies use little memory.
+    :param reply_xml: NETCONF reply or notification XML
+    :param selectors: dict {record type: (XmlPath of the record elements, dict {field: XmlPath relative to the record})}
+    :return: iterator of (record type, dict {field: text}), the first value of each field is kept
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    fields_by_tags = dict((record_type, dict((field_path.tags, field) for field, field_path in fields.items()))
+                          for record_type, (record_path, fields) in selectors.items())
+    tags = []
+    elements = []
+    record_type = None
+    record = None
+    record_depth = 0
+    for offset in range(0, len(reply_xml), XML_CHUNK_SIZE):
+        parser.feed(reply_xml[offset:offset + XML_CHUNK_SIZE])
+        for event, element in parser.read_events():
+            if event == 'start':
+                tags.append(element.tag)
+                elements.append(element)
+                if record is None:
+                    for selector_type, (record_path, fields) in selectors.items():
+                        if record_path.matches(tags):
+                            record_type = selector_type
+                            record = {}
+                            record_depth = len(tags)
+                            break
+                continue
+            if record is not None:
+                field = fields_by_tags[record_type].get(tuple(tags[record_depth:]))
+                if field is not None and field not in record:
+                    record[field] = (element.text or '').strip()
+                if len(tags) == record_depth:
+                    yield record_type, record
+                    record = None
+            tags.pop()
+            elements.pop()
+
+            # detach the processed element from the tree
+
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+    parser.close()
+
+
+def iter_records(reply_xml, record_path, fields):
+    """
+    This function will yield a record for each element of the NETCONF reply selected by {record_path}
+    :param reply_xml: NETCONF reply or notification XML
+    :param record_path: XmlPath of the record elements
+    :param fields: dict {field: XmlPath relative to the record}
+    :return: iterator of dict {field: text}
+    """
+    for record_type, record in extract_records(reply_xml, {'record': (record_path, fields)}):
+        yield record
+
+
+def find_text(reply_xml, path):
+    """
+    This function will return the text of the first element of the NETCONF reply selected by {path}
+    :param reply_xml: NETCONF reply or notification XML
+    :param path: XmlPath
+    :return: text, or None if not found
+    """
+    for record in iter_records(reply_xml, path, {'text': SELF_PATH}):
+        return record['text']
+
+
+# XML paths used to extract the data from the NETCONF replies
+
+SELF_PATH = XmlPath('.')
+HOSTNAME_PATH = XmlPath('ios:native/ios:hostname')
+INTERFACE_STATE_PATH = XmlPath('if:interfaces-state/if:interface')
+INTERFACE_STATE_FIELDS = {'name': XmlPath('if:name'), 'oper-status': XmlPath('if:oper-status')}
+INTERFACE_CONFIG_PATH = XmlPath('if:interfaces/if:interface')
+INTERFACE_CONFIG_FIELDS = {'name': XmlPath('if:name'), 'ip': XmlPath('ip:ipv4/ip:address/ip:ip')}
+SENSOR_PATH = XmlPath('env:environment-sensors/env:environment-sensor')
+SENSOR_FIELDS = {'name': XmlPath('env:name'), 'location': XmlPath('env:location'), 'state': XmlPath('env:state'),
+                 'current-reading': XmlPath('env:current-reading'), 'sensor-units': XmlPath('env:sensor-units')}
+SUBSCRIPTION_ID_PATH = XmlPath('notif:subscription-id')
+SUBSCRIPTION_RESULT_PATH = XmlPath('notif:subscription-result')
+PUSH_SUBSCRIPTION_ID_PATH = XmlPath('yp:subscription-id')
+CONFIG_CHANGE_PATH = XmlPath('ncn:netconf-config-change')
+
+
+class ConfigCache(object):
+    """
+    Cache of the values derived from the device configuration, like the hostname and the interface IPs.
+    A dedicated NETCONF session for each device is subscribed to the NETCONF event stream, and the cached values
+    of the device are dropped when it sends a netconf-config-change notification. The notifications are checked,
+    without waiting, each time a value is read. The values also expire after a TTL, shorter for the devices where
+    the subscription is not available. A failed subscription is retried with an exponential backoff.
+    """
+
+    def __init__(self, ttl=CONFIG_CACHE_TTL, unwatched_ttl=CONFIG_CACHE_UNWATCHED_TTL):
+        """
+        :param ttl: time the values are reused, in seconds, when the device reports its configuration changes
+        :param unwatched_ttl: time the values are reused, in seconds, for the other devices
+        """
+        self.ttl = ttl
+        self.unwatched_ttl = unwatched_ttl
+        self.values = {}
+        self.sessions = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def watch(self, host):
+        """
+        Subscribe to the configuration change notifications of the device, if not already subscribed.
+        The connection gets only the time left before the deadline of the current thread, see NetconfPool.
+        :param host: device IP address or hostname
+        :return: True if subscribed
+        """
+        session = self.sessions.get(host)
+        if session is not None and session.connected:
+            return True
+        failures, retry_time = self.failures.get(host, (0, 0))
+        if time.time() < retry_time:
+            return False
+        timeout = netconf_pool.get_timeout()
+        try:
+            session = netconf_pool.connect(host, timeout)
+            session.create_subscription()
+        except Exception as error:
+            if not failures:
+                print('\nNo configuration change notifications from ', host, ': ', error)
+            self.sessions.pop(host, None)
+            self.failures[host] = (failures + 1, time.time() + min(CONFIG_WATCH_RETRY_MAX_DELAY,
+                                                                     CONFIG_WATCH_RETRY_DELAY * 2 ** failures))
+            return False
+        self.failures.pop(host, None)
+        self.sessions[host] = session
+        return True
+
+    def _check(self, host):
+        """
+        Drop the cached values of the device if it reported a configuration change, or if the session is lost
+        """
+        session = self.sessions.get(host)
+        if session is None:
+            return
+        if not session.connected:
+            self.invalidate(host)
+            self.sessions.pop(host, None)
+            return
+        while True:
+            notification = session.take_notification(block=False)
+            if notification is None:
+                return
+            if find_text(notification.notification_xml, CONFIG_CHANGE_PATH) is not None:
+                self.invalidate(host)
+
+    def get(self, host, key, fetch):
+        """
+        Return the cached value {key} of the device, call fetch() to get it when missing or expired
+        :param host: device IP address or hostname
+        :param key: value name, like 'hostname'
+        :param fetch: function returning the value, called without arguments
+        :return: the value
+        """
+        with self._lock:
+            self._check(host)
+            value, expires = self.values.get((host, key), (None, 0))
+            if expires > time.time():
+                return value
+
+        # subscribe before reading the value, so a change made meanwhile is not missed
+
+        watched = self.watch(host)
+        value = fetch()
+        self.set(host, key, value, watched)
+        return value
+
+    def peek(self, host, key):
+        """
+        :return: the cached value {key} of the device, None if missing or expired
+        """
+        with self._lock:
+            self._check(host)
+            value, expires = self.values.get((host, key), (None, 0))
+            return value if expires > time.time() else None
+
+    def set(self, host, key, value, watched=None):
+        """
+        Save the value {key} of the device
+        :param watched: True if the device reports its configuration changes, default if it is subscribed
+        """
+        if watched is None:
+            watched = self.watch(host)
+        with self._lock:
+            self.values[(host, key)] = (value, time.time() + (self.ttl if watched else self.unwatched_ttl))
+
+    def invalidate(self, host):
+        for key in [key for key in self.values if key[0] == host]:
+            del self.values[key]
+
+    def close(self):
+        """
+        Close the notification sessions
+        :return: none
+        """
+        with self._lock:
+            for host, session in list(self.sessions.items()):
+                try:
+                    session.close_session()
+                except Exception:
+                    pass
+            self.sessions = {}
+            self.values = {}
+            self.failures = {}
+
+
+# configuration derived values, shared by the query functions
+
+config_cache = ConfigCache()
+
+
+def get_hostname(host=HOST):
+    """
+    This function will retrieve the switch configured hostname using NETCONF, cached until the configuration changes
+    :param host: device IP address or hostname
+    :return hostname: device hostname
+    """
+    return config_cache.get(host, 'hostname', lambda: fetch_hostname(host))
+
+
+def fetch_hostname(host=HOST):
+    """
+    This function will retrieve the switch configured hostname using NETCONF, see get_hostname
+    :param host: device IP address or hostname
     :return hostname: device hostname
     """
 
-    with manager.connect(host=HOST, port=PORT, username=USER,
-                         password=PASS, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
-        # XML filter to issue with the get operation
-        # IOS-XE 16.5+        YANG model "Cisco-IOS-XE-native"
-        hostname_filter = '''
-                          <filter>
-                              <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
-                                  <hostname></hostname>
-                              </native>
-                          </filter>
-                          '''
-        result = m.get_config('running', hostname_filter)
-        xml_doc = xml.dom.minidom.parseString(result.xml)
-        hostname = xml_doc.getElementsByTagName('hostname')
-        device_hostname = hostname[0].firstChild.nodeValue
+    # XML filter to issue with the get operation
+    # IOS-XE 16.5+        YANG model "Cisco-IOS-XE-native"
+    hostname_filter = '''
+                      <filter>
+                          <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+                              <hostname></hostname>
+                          </native>
+                      </filter>
+                      '''
+    result = netconf_pool.rpc(host, 'get_config', 'running', hostname_filter)
+    device_hostname = find_text(result.xml, HOSTNAME_PATH)
     return device_hostname
 
 
-def get_up_interfaces():
+def get_up_interfaces(host=HOST):
     """
     This function will return the interfaces that are operational state up, using NETCONF.
+    :param host: device IP address or hostname
     :return interfaces: list of device interfaces
     """
 
-    with manager.connect(host=HOST, port=PORT, username=USER,
-                         password=PASS, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
-        # XML filter to issue with the get operation
-        # IOS-XE 16.5+        YANG model called "ietf-interfaces"
-
-        interface_up_filter = '''
-                            <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
-                                <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                                    <interface>
-                                        <oper-status>up</oper-status>
-                                    </interface>
-                                </interfaces-state>
-                            </filter>
-                           '''
-
-        result = m.get(interface_up_filter)
-
-        xml_doc = xml.dom.minidom.parseString(result.xml)
-        # data = ET.fromstring(xml_doc)
-        interfaces = []
-        interface_name = xml_doc.getElementsByTagName('name')
-        number_int = len(interface_name)
-        index = 0
-        while index < number_int:
-            interfaces.append(interface_name[index].firstChild.nodeValue)
-            index += 1
+    # XML filter to issue with the get operation
+    # IOS-XE 16.5+        YANG model called "ietf-interfaces"
+
+    interface_up_filter = '''
+                        <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                            <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                                <interface>
+                                    <oper-status>up</oper-status>
+                                </interface>
+                            </interfaces-state>
+                        </filter>
+                       '''
+
+    result = netconf_pool.rpc(host, 'get', interface_up_filter)
+
+    interfaces = []
+    for interface in iter_records(result.xml, INTERFACE_STATE_PATH, INTERFACE_STATE_FIELDS):
+        if interface.get('oper-status') == 'up':
+            interfaces.append(interface['name'])
     return interfaces
 
 
-def get_interface_ip(interface):
+def get_interface_ip(interface, host=HOST):
     """
     This function will retrieve the IPv4 address configured on the interface via NETCONF
     :param interface: interface name
+    :param host: device IP address or hostname
     :return: int_ip_add: the interface IPv4 address
     """
+    int_ip_add = get_interface_ips(host).get(interface)
+    if not int_ip_add:
+        int_ip_add = 'not configured'
 
-    with manager.connect(host=HOST, port=PORT, username=USER,
-                         password=PASS, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
-        # XML filter to issue with the get operation
-        # IOS-XE 16.5+        YANG model called "ietf-interfaces"
-
-        interface_state_filter = '''
-                                    <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
-                                        <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-                                            <interface>
-                                                <name> ''' + interface + '''</name>
-                                            </interface>
-                                        </interfaces>
-                                    </filter>
-                                '''
-        result = m.get(interface_state_filter)
-        xml_doc = xml.dom.minidom.parseString(result.xml)
-        ip_add = xml_doc.getElementsByTagName('ip')
-        try:
-            int_ip_add = ip_add[0].firstChild.nodeValue
-        except:
-            int_ip_add = 'not configured'
+    return int_ip_add
 
-        return int_ip_add
+
+def get_interface_ips(host=HOST):
+    """
+    This function will retrieve the IPv4 addresses configured on all the interfaces, cached until the configuration
+    changes
+    :param host: device IP address or hostname
+    :return: dict {interface name: IPv4 address or None}
+    """
+    return config_cache.get(host, 'interface ips', lambda: fetch_interface_ips(host))
 
 
-def get_temperature(sensor_number):
+def fetch_interface_ips(host=HOST):
     """
-    This function will get the temperature for the sensor with the {sensor_number}
-    :param sensor_number: switch sensor number
-    :return: temperature in Celsius degrees
+    This function will retrieve the IPv4 addresses configured on all the interfaces via NETCONF, see get_interface_ips
+    :param host: device IP address or hostname
+    :return: dict {interface name: IPv4 address or None}
+    """
+
+    # XML filter to issue with the get operation
+    # IOS-XE 16.5+        YANG models called "ietf-interfaces" and "ietf-ip"
+
+    interfaces_filter = '''
+                        <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                                <interface>
+                                    <name/>
+                                    <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip"/>
+                                </interface>
+                            </interfaces>
+                        </filter>
+                        '''
+    result = netconf_pool.rpc(host, 'get', interfaces_filter)
+    interface_ips = {}
+    for interface in iter_records(result.xml, INTERFACE_CONFIG_PATH, INTERFACE_CONFIG_FIELDS):
+        interface_ips[interface.get('name')] = interface.get('ip') or None
+    return interface_ips
+
+
+def get_interfaces_info(host=HOST):
     """
-    with manager.connect(host=HOST, port=PORT, username=USER,
-                         password=PASS, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
-        # XML filter to issue with the get operation
-        # IOS-XE 16.6+        YANG model called "Cisco-IOS-XE-environment-oper"
-        sensor_filter = '''
+    This function will collect the operational state and the configured IPv4 address of all the interfaces.
+    The operational state is always read from the device, the IPv4 addresses come from the configuration cache,
+    when they are not cached, both the "interfaces-state" and the "interfaces" data are read with one NETCONF get.
+    :param host: device IP address or hostname
+    :return: dict {interface name: {'oper-status': operational state, 'ip': IPv4 address or None}}
+    """
+
+    # XML filter to issue with the get operation
+    # IOS-XE 16.5+        YANG models called "ietf-interfaces" and "ietf-ip"
+
+    interface_ips = config_cache.peek(host, 'interface ips')
+    interfaces_filter = '''
                         <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
-                            <environment-sensors xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper">
-                                <environment-sensor>
-                                    <name>''' + sensor_number + ''' </name>
-                                </environment-sensor>
-                            </environment-sensors>
+                            <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                                <interface>
+                                    <name/>
+                                    <oper-status/>
+                                </interface>
+                            </interfaces-state>'''
+    if interface_ips is None:
+        config_cache.watch(host)
+        interfaces_filter += '''
+                            <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                                <interface>
+                                    <name/>
+                                    <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip"/>
+                                </interface>
+                            </interfaces>'''
+    interfaces_filter += '''
                         </filter>
                         '''
-        result = m.get(sensor_filter)
-        xml_doc = xml.dom.minidom.parseString(result.xml)
-        temp = xml_doc.getElementsByTagName('current-reading')
-        temperature = temp[0].firstChild.nodeValue
-        status = xml_doc.getElementsByTagName('state')
-        state = status[0].firstChild.nodeValue
+    result = netconf_pool.rpc(host, 'get', interfaces_filter)
+
+    # join the operational state and the configuration by interface name
+
+    interfaces_info = {}
+    selectors = {'state': (INTERFACE_STATE_PATH, INTERFACE_STATE_FIELDS)}
+    if interface_ips is None:
+        interface_ips = {}
+        selectors['config'] = (INTERFACE_CONFIG_PATH, INTERFACE_CONFIG_FIELDS)
+    for record_type, interface in extract_records(result.xml, selectors):
+        if record_type == 'state':
+            interfaces_info[interface.get('name')] = {'oper-status': interface.get('oper-status'), 'ip': None}
+        else:
+            interface_ips[interface.get('name')] = interface.get('ip') or None
+    if 'config' in selectors:
+        config_cache.set(host, 'interface ips', interface_ips)
+    for name, interface_info in interfaces_info.items():
+        interface_info['ip'] = interface_ips.get(name)
+    return interfaces_info
+
+
+def get_temperature(sensor_number, host=HOST):
+    """
+    This function will get the temperature for the sensor with the {sensor_number}
+    :param sensor_number: switch sensor number
+    :param host: device IP address or hostname
+    :return: temperature in Celsius degrees
+    """
+    # XML filter to issue with the get operation
+    # IOS-XE 16.6+        YANG model called "Cisco-IOS-XE-environment-oper"
+    sensor_filter = '''
+                    <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                        <environment-sensors xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper">
+                            <environment-sensor>
+                                <name>''' + sensor_number + '''</name>
+                            </environment-sensor>
+                        </environment-sensors>
+                    </filter>
+                    '''
+    result = netconf_pool.rpc(host, 'get', sensor_filter)
+    sensor = next(iter_records(result.xml, SENSOR_PATH, SENSOR_FIELDS))
+    temperature = sensor['current-reading']
+    state = sensor['state']
     return temperature, state
 
 
-def get_outside_temperature():
+def get_sensors(host=HOST):
+    """
+    This function will get the readings of all the environment sensors, with one NETCONF get
+    :param host: device IP address or hostname
+    :return: dict {sensor name: {'current-reading': reading, 'state': state, 'location': .., 'sensor-units': ..}},
+    the first reading is kept when a name is reported more than once, like get_temperature
+    """
+    sensors_filter = '''
+                    <filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+                        <environment-sensors xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper"/>
+                    </filter>
+                    '''
+    result = netconf_pool.rpc(host, 'get', sensors_filter)
+    return parse_sensors(result.xml)
+
+
+def parse_sensors(reply_xml):
+    """
+    This function will parse the environment sensors readings from a NETCONF reply or YANG push notification
+    :param reply_xml: NETCONF reply or notification XML
+    :return: dict {sensor name: {'current-reading': reading, 'state': state, 'location': .., 'sensor-units': ..}}
+    """
+    sensors = {}
+    for sensor in iter_records(reply_xml, SENSOR_PATH, SENSOR_FIELDS):
+        if sensor.get('name') in sensors or not sensor.get('current-reading'):
+            continue
+        sensor['current-reading'] = float(sensor['current-reading'])
+        sensors[sensor.pop('name')] = sensor
+    return sensors
+
+
+class RingBuffer(object):
+    """
+    Fixed size time series, the oldest samples are overwritten once the buffer is full.
+    The samples are stored in two preallocated arrays of doubles, so the memory used does not grow over time.
+    The aggregates are computed over the last {window} samples, or over all the samples kept.
+    """
+
+    def __init__(self, size=SENSOR_HISTORY):
+        """
+        :param size: maximum number of samples kept
+        """
+        self.size = size
+        self.times = array.array('d', bytes(8 * size))
+        self.values = array.array('d', bytes(8 * size))
+        self.count = 0
+        self._next = 0
+
+    def append(self, sample_time, value):
+        self.times[self._next] = sample_time
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def _indexes(self, window=None):
+        count = self.count if window is None else min(window, self.count)
+        return [(self._next - count + index) % self.size for index in range(count)]
+
+    def samples(self, window=None):
+        """
+        :param window: number of recent samples
+        :return: list of (time, value), oldest first
+        """
+        return [(self.times[index], self.values[index]) for index in self._indexes(window)]
+
+    def last(self):
+        """
+        :return: the most recent value, None if empty
+        """
+        if not self.count:
+            return None
+        return self.values[(self._next - 1) % self.size]
+
+    def minimum(self, window=None):
+        return min(self.values[index] for index in self._indexes(window)) if self.count else None
+
+    def maximum(self, window=None):
+        return max(self.values[index] for index in self._indexes(window)) if self.count else None
+
+    def mean(self, window=None):
+        indexes = self._indexes(window)
+        return sum(self.values[index] for index in indexes) / len(indexes) if indexes else None
+
+    def percentile(self, percent, window=None):
+        """
+        :param percent: percentile, 0 to 100
+        :param window: number of recent samples
+        :return: the nearest rank percentile of the values, None if empty
+        """
+        values = sorted(self.values[index] for index in self._indexes(window))
+        if not values:
+            return None
+        rank = max(0, min(len(values), int(math.ceil(percent / 100.0 * len(values)))) - 1)
+        return values[rank]
+
+    def rate(self, window=None):
+        """
+        :param window: number of recent samples
+        :return: rate of change per minute between the first and the last sample, None if less than two samples
+        """
+        indexes = self._indexes(window)
+        if len(indexes) < 2 or self.times[indexes[-1]] == self.times[indexes[0]]:
+            return None
+        first, last = indexes[0], indexes[-1]
+        return 60 * (self.values[last] - self.values[first]) / (self.times[last] - self.times[first])
+
+
+class SensorSampler(object):
+    """
+    Sampler reading all the environment sensors of a device with one NETCONF get, and keeping a fixed size
+    history for each device and sensor. The threshold checks use the aggregates of the history, the device
+    is only queried by sample(). With a TelemetryStore, all the readings are also saved to disk.
+    """
+
+    def __init__(self, history=SENSOR_HISTORY, store=None):
+        """
+        :param history: number of samples kept for each sensor
+        :param store: TelemetryStore, none to keep only the in-memory history
+        """
+        self.history = history
+        self.store = store
+        self.buffers = {}
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, sample_time, sensors, hostname=None):
+        """
+        Add the sensor readings collected at {sample_time}
+        :param host: device IP address or hostname
+        :param sample_time: sample time, in seconds since the epoch
+        :param sensors: dict {sensor name: {'current-reading': reading, 'state': state, ..}}, see get_sensors
+        :param hostname: device hostname, saved as the device label in the store, the readings are saved by host
+        :return: none
+        """
+        with self._lock:
+            for name, sensor in sensors.items():
+                key = (host, name)
+                if key not in self.buffers:
+                    self.buffers[key] = RingBuffer(self.history)
+                self.buffers[key].append(sample_time, sensor['current-reading'])
+                self.states[key] = sensor.get('state')
+                if self.store is not None:
+                    self.store.append(host, name, sample_time, sensor['current-reading'], hostname)
+
+    def sample(self, host=HOST):
+        """
+        Read all the sensors of the device, and add the readings to the history
+        :param host: device IP address or hostname
+        :return: the sensor readings, see get_sensors
+        """
+        sample_time = time.time()
+        sensors = get_sensors(host)
+        self.record(host, sample_time, sensors)
+        return sensors
+
+    def series(self, host, sensor_name):
+        """
+        :param host: device IP address or hostname
+        :param sensor_name: sensor name, like "Temp Sensor 0"
+        :return: the RingBuffer of the sensor readings, None if the sensor was never sampled
+        """
+        return self.buffers.get((host, sensor_name))
+
+    def state(self, host, sensor_name):
+        return self.states.get((host, sensor_name))
+
+    def smoothed(self, host, sensor_name, window=SMOOTHING_WINDOW):
+        """
+        :return: the mean of the last {window} readings of the sensor, None if the sensor was never sampled
+        """
+        series = self.series(host, sensor_name)
+        return series.mean(window) if series else None
+
+
+def establish_subscription(session, xpath, period=None, dampening_period=None):
+    """
+    This function will create a YANG push subscription, periodic if {period}, else on-change
+    :param session: ncclient manager, the notifications are received on this session
+    :param xpath: XPath filter of the subscribed data
+    :param period: update period, in centiseconds
+    :param dampening_period: on-change dampening period, in centiseconds
+    :return: subscription id
+    """
+    if period is not None:
+        trigger = '<yp:period>' + str(period) + '</yp:period>'
+    else:
+        trigger = '<yp:dampening-period>' + str(dampening_period or 0) + '</yp:dampening-period>'
+    subscription_rpc = '''
+                    <establish-subscription xmlns="urn:ietf:params:xml:ns:yang:ietf-event-notifications"
+                                            xmlns:yp="urn:ietf:params:xml:ns:yang:ietf-yang-push">
+                        <stream>yp:yang-push</stream>
+                        <yp:xpath-filter>''' + xpath + '''</yp:xpath-filter>
+                        ''' + trigger + '''
+                    </establish-subscription>
+                    '''
+    result = session.dispatch(to_ele(subscription_rpc))
+    subscription_result = find_text(result.xml, SUBSCRIPTION_RESULT_PATH) or ''
+    subscription_id = find_text(result.xml, SUBSCRIPTION_ID_PATH)
+    if not subscription_result.endswith('ok') or subscription_id is None:
+        raise RuntimeError('Subscription to ' + xpath + ' failed: ' + subscription_result)
+    return subscription_id
+
+
+class TelemetrySubscription(object):
+    """
+    YANG push subscriptions to the environment sensors, updated periodically, and to the interfaces operational
+    state, updated on change. The notifications are received on a dedicated NETCONF session, not on the pooled
+    one, so the query functions can still be used while waiting for updates.
+    """
+
+    def __init__(self, host=HOST, period=SUBSCRIPTION_PERIOD, dampening_period=SUBSCRIPTION_DAMPENING):
+        """
+        :param host: device IP address or hostname
+        :param period: sensors update period, in centiseconds
+        :param dampening_period: interfaces state dampening period, in centiseconds
+        """
+        self.host = host
+        self.period = period
+        self.dampening_period = dampening_period
+        self.session = None
+        self.subscriptions = {}
+
+    def start(self):
+        """
+        Open the notification session and create the subscriptions
+        :return: none
+        """
+        self.session = netconf_pool.connect(self.host)
+        sensors_id = establish_subscription(self.session, '/environment-ios-xe-oper:environment-sensors',
+                                            period=self.period)
+        self.subscriptions[sensors_id] = 'sensors'
+        interfaces_id = establish_subscription(self.session, '/if:interfaces-state/interface/oper-status',
+                                               dampening_period=self.dampening_period)
+        self.subscriptions[interfaces_id] = 'interfaces'
+
+    def updates(self):
+        """
+        Wait for the YANG push notifications, and parse them
+        :return: iterator of (update type, time, data): ('sensors', time, readings, see get_sensors)
+        or ('interfaces', time, dict {interface name: operational state})
+        """
+        while self.session.connected:
+            notification = self.session.take_notification(block=True, timeout=NOTIFICATION_WAIT)
+            if notification is None:
+                continue
+            notification_xml = notification.notification_xml
+            update_type = self.subscriptions.get(find_text(notification_xml, PUSH_SUBSCRIPTION_ID_PATH))
+            if update_type == 'sensors':
+                yield update_type, time.time(), parse_sensors(notification_xml)
+            elif update_type == 'interfaces':
+                interfaces = {}
+                for interface in iter_records(notification_xml, INTERFACE_STATE_PATH, INTERFACE_STATE_FIELDS):
+                    interfaces[interface['name']] = interface.get('oper-status')
+                yield update_type, time.time(), interfaces
+        raise TransportError('NETCONF notification session to ' + self.host + ' closed')
+
+    def close(self):
+        """
+        Close the notification session, the device deletes its subscriptions
+        :return: none
+        """
+        if self.session is not None and self.session.connected:
+            self.session.close_session()
+        self.session = None
+        self.subscriptions = {}
+
+
+class WeatherCache(object):
+    """
+    Cache of the weather.gov hourly forecasts, by location. A forecast is reused for {ttl} seconds, then revalidated
+    with a conditional request (ETag, Last-Modified). The callers asking for the same location share one request,
+    and when weather.gov is slow, the expired forecast is returned while the request completes in the background.
+    """
+
+    def __init__(self, ttl=WEATHER_TTL, timeout=WEATHER_TIMEOUT, request_timeout=WEATHER_REQUEST_TIMEOUT):
+        """
+        :param ttl: time a forecast is reused, in seconds
+        :param timeout: maximum wait for weather.gov when an expired forecast is available, in seconds
+        :param request_timeout: weather.gov request timeout, in seconds
+        """
+        self.ttl = ttl
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self.session = requests.Session()
+        self.forecasts = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4)
+
+    def _fetch(self, location):
+        url = 'https://api.weather.gov/points/' + str(location[0]) + ',' + str(location[1]) + '/forecast/hourly'
+        header = {'accept': 'application/ld+json'}
+        forecast = self.forecasts.get(location)
+        if forecast is not None:
+            if forecast['etag']:
+                header['If-None-Match'] = forecast['etag']
+            if forecast['last_modified']:
+                header['If-Modified-Since'] = forecast['last_modified']
+        try:
+            response = self.session.get(url, headers=header, verify=False, timeout=self.request_timeout)
+            if response.status_code == 304 and forecast is not None:
+                forecast = dict(forecast, expires=time.time() + self.ttl)
+            else:
+                response.raise_for_status()
+                forecast = {'temperature': response.json()['periods'][0]['temperature'],
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'expires': time.time() + self.ttl}
+            with self._lock:
+                self.forecasts[location] = forecast
+            return forecast
+        finally:
+            with self._lock:
+                self._requests.pop(location, None)
+
+    def get(self, location):
+        """
+        :param location: GPS coordinates (latitude, longitude)
+        :return: the current temperature, in Fahrenheit
+        """
+        with self._lock:
+            forecast = self.forecasts.get(location)
+            if forecast is not None and forecast['expires'] > time.time():
+                return forecast['temperature']
+            request = self._requests.get(location)
+            if request is None:
+                request = self._executor.submit(self._fetch, location)
+                self._requests[location] = request
+        if forecast is None:
+            return request.result()['temperature']
+        try:
+            return request.result(timeout=self.timeout)['temperature']
+        except TimeoutError:
+            return forecast['temperature']
+        except (requests.exceptions.RequestException, ValueError, KeyError) as error:
+            print('\nUnable to update the outside temperature: ', error)
+            return forecast['temperature']
+
+
+weather_cache = WeatherCache()
+
+
+def get_outside_temperature(location=OFFICE_LOCATION):
     """
     This function will collect the outside temperature for the office located at the GPS coordinates {x,y}
+    :param location: GPS coordinates (latitude, longitude)
     :return: current temperature
     """
-    url = "https://api.weather.gov/points/45.4176,-122.7331/forecast/hourly"
-    header = {'accept': 'application/ld+json'}
-    response = requests.get(url, headers=header, verify=False)
-    outside_temp_json = response.json()
-    outside_temp = int(((outside_temp_json["periods"][0]["temperature"]) - 32) / 1.8)
+    outside_temp = int((weather_cache.get(location) - 32) / 1.8)
     return outside_temp
 
 
@@ -191,6 +1106,373 @@ def get_input_timeout(message, wait_time):
     return input_value
 
 
+class AlertDispatcher(object):
+    """
+    Queue of the alerts to tweet, sent by a background thread, so the monitoring never waits for twitter.com.
+    The alerts are keyed, like (hostname, 'temperature'): a new alert replaces the pending alert with the same key,
+    and an alert identical to the last one sent for its key is dropped. The status updates are rate limited, the
+    failed updates are retried with an exponential backoff, and when the backlog is full the oldest alert is dropped.
+    """
+
+    def __init__(self, twitter, rate=ALERT_RATE, rate_period=ALERT_RATE_PERIOD, backlog=ALERT_BACKLOG,
+                 retries=ALERT_RETRIES):
+        """
+        :param twitter: Twython client
+        :param rate: maximum number of status updates in {rate_period}
+        :param rate_period: rate limit period, in seconds
+        :param backlog: maximum number of alerts waiting to be sent
+        :param retries: number of retries for each alert
+        """
+        self.twitter = twitter
+        self.rate = rate
+        self.rate_period = rate_period
+        self.backlog = backlog
+        self.retries = retries
+        self.pending = collections.OrderedDict()
+        self.last_sent = {}
+        self.sent_times = collections.deque()
+        self.dropped = 0
+        self.failed = 0
+        self._sending = None
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def alert(self, key, message):
+        """
+        Queue the alert, this function does not block
+        :param key: the alert key, the device and the alert type
+        :param message: the status update
+        :return: none
+        """
+        with self._condition:
+            if key not in self.pending and (self.last_sent.get(key) == message or self._sending == (key, message)):
+                return
+            self.pending[key] = message
+            while len(self.pending) > self.backlog:
+                dropped_key, dropped_message = self.pending.popitem(last=False)
+                self.dropped += 1
+                print('\nAlert backlog full, dropped: ', dropped_message)
+            self._condition.notify()
+
+    def _wait_rate_limit(self):
+        while len(self.sent_times) >= self.rate:
+            delay = self.sent_times[0] + self.rate_period - time.time()
+            if delay <= 0:
+                self.sent_times.popleft()
+            elif self._stop.wait(delay):
+                return False
+        return True
+
+    def _retry_delay(self, error, attempt):
+        """
+        :return: the delay before the next retry, in seconds, None if the status update should not be retried
+        """
+        if attempt >= self.retries or isinstance(error, TwythonAuthError):
+            return None
+        backoff = min(ALERT_RETRY_MAX_DELAY, ALERT_RETRY_DELAY * 2 ** attempt) * random.uniform(0.5, 1)
+        if isinstance(error, TwythonRateLimitError):
+
+            # Twython reports the time of the rate limit reset, in seconds since the epoch
+
+            try:
+                return min(max(float(error.retry_after) - time.time(), backoff), self.rate_period)
+            except (TypeError, ValueError):
+                return backoff
+
+        # the other client errors, like a duplicate status, will fail again
+
+        if isinstance(error, TwythonError) and error.error_code is not None and error.error_code < 500:
+            return None
+        return backoff
+
+    def _send(self, key, message):
+        attempt = 0
+        while True:
+            if not self._wait_rate_limit():
+                return
+            self.sent_times.append(time.time())
+            try:
+                self.twitter.update_status(status=message)
+                print('\nTweet sent: ', message)
+                with self._condition:
+                    self.last_sent[key] = message
+                return
+            except Exception as error:
+                delay = self._retry_delay(error, attempt)
+                if delay is None:
+                    self.failed += 1
+                    print('\nUnable to tweet: ', message, ', ', error)
+                    return
+            attempt += 1
+            if self._stop.wait(delay):
+                return
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self.pending and not self._stop.is_set():
+                    self._condition.wait()
+                if not self.pending:
+                    return
+                key, message = self.pending.popitem(last=False)
+                self._sending = (key, message)
+            self._send(key, message)
+            with self._condition:
+                self._sending = None
+                self._condition.notify_all()
+
+    def close(self, timeout=ALERT_FLUSH_TIMEOUT):
+        """
+        Wait up to {timeout} seconds for the pending alerts to be sent, and stop the dispatcher
+        :param timeout: maximum wait, in seconds
+        :return: none
+        """
+        end_time = time.time() + timeout
+        with self._condition:
+            while (self.pending or self._sending) and time.time() < end_time:
+                self._condition.wait(end_time - time.time())
+            if self.pending:
+                print('\nAlerts not sent: ', len(self.pending))
+            self._stop.set()
+            self._condition.notify_all()
+
+
+def load_fleet(filename):
+    """
+    This function will load the fleet inventory from a CSV file with the header: host,port,username,password.
+    Only the host is required, the NETCONF port and the user credentials default to PORT, USER and PASS.
+    :param filename: CSV file name
+    :return: list of the device IP addresses or hostnames
+    """
+    hosts = []
+    with open(filename) as f:
+        for device in csv.DictReader(f):
+            host = device['host'].strip()
+            port = device.get('port')
+            netconf_pool.add_device(host, int(port) if port else None, device.get('username') or None,
+                                    device.get('password') or None)
+            hosts.append(host)
+    return hosts
+
+
+def poll_device(host, sensor_number=INLET_SENSOR):
+    """
+    This function will collect the device telemetry: hostname, all the sensors, "up" interfaces.
+    The hostname is cached until the device configuration changes, see get_hostname.
+    :param host: device IP address or hostname
+    :param sensor_number: switch sensor number reported as the sample temperature and state
+    :return: sample, dict with the host, time, hostname, temperature, state, sensors and interfaces
+    """
+    sample_time = time.time()
+    hostname = get_hostname(host)
+    sensors = get_sensors(host)
+    interfaces = [name for name, info in get_interfaces_info(host).items() if info['oper-status'] == 'up']
+    return {'host': host, 'time': sample_time, 'hostname': hostname,
+            'temperature': int(sensors[sensor_number]['current-reading']), 'state': sensors[sensor_number]['state'],
+            'sensors': sensors, 'interfaces': interfaces}
+
+
+class FleetPoller(object):
+    """
+    Poller collecting the telemetry of many devices, at a fixed interval, with a bounded pool of worker threads.
+    Each device gets a random phase in the interval, and each poll a small random delay, so the polls are spread
+    over the interval. A poll still running when the next one is due is not overlapped, the sample is skipped.
+    Each poll has a deadline, its NETCONF RPCs get only the time left, so a slow device does not hold a worker
+    much longer than the deadline, see NetconfPool.set_deadline.
+    """
+
+    def __init__(self, hosts, on_sample, on_error=None, interval=FLEET_INTERVAL, workers=FLEET_WORKERS,
+                 deadline=None, collect=poll_device):
+        """
+        :param hosts: list of the device IP addresses or hostnames
+        :param on_sample: function called with each sample
+        :param on_error: function called with the host and the error for the failed polls
+        :param interval: sample interval, in seconds
+        :param workers: maximum number of devices polled at the same time
+        :param deadline: maximum poll duration, in seconds, default the interval
+        :param collect: function collecting the sample for a host, called with the host
+        """
+        self.hosts = hosts
+        self.on_sample = on_sample
+        self.on_error = on_error or (lambda host, error: print('\nUnable to poll ', host, ': ', error))
+        self.interval = interval
+        self.workers = workers
+        self.deadline = deadline or interval
+        self.collect = collect
+        self.skipped = 0
+        self._stop = threading.Event()
+
+    def _poll(self, host):
+        start_time = time.time()
+        netconf_pool.set_deadline(start_time + self.deadline)
+        try:
+            sample = self.collect(host)
+        except Exception as error:
+            self.on_error(host, error)
+            return
+        finally:
+            netconf_pool.set_deadline(None)
+        sample['late'] = time.time() - start_time > self.deadline
+        self.on_sample(sample)
+
+    def run(self, duration=None):
+        """
+        Poll the devices until stop() is called, or for {duration} seconds
+        :param duration: polling duration, in seconds
+        :return: none
+        """
+        start_time = time.time()
+        end_time = start_time + duration if duration else None
+
+        # the heap holds (next poll time, scheduled sample time, host)
+
+        schedule = []
+        for host in self.hosts:
+            sample_time = start_time + random.uniform(0, self.interval)
+            schedule.append((sample_time, sample_time, host))
+        heapq.heapify(schedule)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while schedule and not self._stop.is_set():
+                poll_time, sample_time, host = schedule[0]
+                now = time.time()
+                if end_time is not None and poll_time > end_time:
+                    break
+                if poll_time > now:
+                    self._stop.wait(poll_time - now)
+                    continue
+                heapq.heappop(schedule)
+                previous = running.get(host)
+                if previous is not None and not previous.done():
+                    self.skipped += 1
+                else:
+                    running[host] = executor.submit(self._poll, host)
+
+                # keep the fixed interval, skip the samples already missed
+
+                sample_time += self.interval
+                while sample_time < now:
+                    sample_time += self.interval
+                poll_time = sample_time + random.uniform(0, FLEET_JITTER * self.interval)
+                heapq.heappush(schedule, (poll_time, sample_time, host))
+
+    def stop(self):
+        self._stop.set()
+
+
+def poll_fleet(hosts, temp_threshold, interval=FLEET_INTERVAL, workers=FLEET_WORKERS, dispatcher=None,
+               store=None):
+    """
+    This function will poll the devices in {hosts} every {interval} seconds, and print the temperature samples.
+    It will print an alert when a device smoothed inlet temperature exceeds the threshold, and tweet it.
+    :param hosts: list of the device IP addresses or hostnames
+    :param temp_threshold: temperature threshold, in Celsius
+    :param interval: sample interval, in seconds
+    :param workers: maximum number of devices polled at the same time
+    :param dispatcher: AlertDispatcher used to tweet the alerts, none to only print them
+    :param store: TelemetryStore saving the sensor readings, and the outside temperature once per interval
+    :return: none
+    """
+    sampler = SensorSampler(store=store)
+    outside_times = [0]
+
+    def print_sample(sample):
+        sampler.record(sample['host'], sample['time'], sample['sensors'], sample['hostname'])
+        if store is not None and sample['time'] - outside_times[0] >= interval:
+            outside_times[0] = sample['time']
+            record_outside_temperature(store)
+        smoothed = sampler.smoothed(sample['host'], INLET_SENSOR)
+        print(' {0:20} {1:25} {2:4} {3:6.1f} {4:8} {5:4} interfaces up'.format(
+            sample['host'], sample['hostname'], sample['temperature'], smoothed, sample['state'],
+            len(sample['interfaces'])))
+        if smoothed > temp_threshold:
+            print('\nSwitch ', sample['hostname'], ' intake temperature exceeded threshold')
+            if dispatcher is not None:
+                dispatcher.alert((sample['hostname'], 'temperature'), sample['hostname'] +
+                                 ' ALERT: inlet air temp (in Celsius): ' + str(sample['temperature']) +
+                                 ', state: ' + sample['state'])
+
+    print('\nPolling ', len(hosts), ' devices every ', interval, ' seconds')
+    poller = FleetPoller(hosts, print_sample, interval=interval, workers=workers)
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        poller.stop()
+
+
+def record_outside_temperature(store):
+    """
+    This function will save the outside temperature in the telemetry store, errors are printed, not raised
+    :param store: TelemetryStore
+    :return: none
+    """
+    from telemetry_store import OUTSIDE_DEVICE, OUTSIDE_SENSOR  # only required with a telemetry store
+
+    try:
+        store.append(OUTSIDE_DEVICE, OUTSIDE_SENSOR, time.time(), get_outside_temperature())
+    except (requests.exceptions.RequestException, ValueError, KeyError) as error:
+        print('\nUnable to get the outside temperature: ', error)
+
+
+def check_temperature(sampler, device_hostname, sensors, temp_threshold, host=HOST):
+    """
+    This function will print the inlet temperature, and check the smoothed inlet temperature against the threshold
+    :param sampler: SensorSampler, with the {sensors} readings already recorded
+    :param device_hostname: device hostname
+    :param sensors: the last sensor readings, see get_sensors
+    :param temp_threshold: temperature threshold, in Celsius
+    :param host: device IP address or hostname
+    :return: temperature, sensor state, True if the threshold is exceeded
+    """
+    temp = int(sensors[INLET_SENSOR]['current-reading'])
+    state = sensors[INLET_SENSOR]['state']
+    inlet = sampler.series(host, INLET_SENSOR)
+    smoothed_temp = sampler.smoothed(host, INLET_SENSOR)
+    print('\nSwitch ', device_hostname, ' intake temperature: ', temp, ' Celsius')
+    print('Switch ', device_hostname, ' temperature sensor state: ', state)
+    print('Switch ', device_hostname, ' intake temperature average: {0:.1f}, min: {1:.0f}, max: {2:.0f}'.format(
+        smoothed_temp, inlet.minimum(), inlet.maximum()), ' Celsius')
+    if smoothed_temp <= temp_threshold:
+        print('Temperature is lower that threshold!')
+        return temp, state, False
+    print('\nSwitch ', device_hostname, ' intake temperature exceeded threshold')
+    return temp, state, True
+
+
+def watch_temperature(device_hostname, temp_threshold, sampler, host=HOST):
+    """
+    This function will subscribe to the switch sensors and interfaces state, and wait until the smoothed inlet
+    temperature exceeds the threshold. The interfaces state changes are printed as they are received,
+    the first update, with the initial state of the interfaces, is not printed.
+    :param device_hostname: device hostname
+    :param temp_threshold: temperature threshold, in Celsius
+    :param sampler: SensorSampler, the pushed readings are recorded in it
+    :param host: device IP address or hostname
+    :return: temperature, sensor state
+    """
+    print('\nTemperature threshold set up to: ', temp_threshold, ' Celsius')
+    subscription = TelemetrySubscription(host)
+    subscription.start()
+    interface_states = {}
+    try:
+        for update_type, update_time, data in subscription.updates():
+            if update_type == 'interfaces':
+                for intf, oper_status in data.items():
+                    if intf in interface_states and interface_states[intf] != oper_status:
+                        print('\nSwitch ', device_hostname, ' interface ', intf, ' operational state: ', oper_status)
+                    interface_states[intf] = oper_status
+                continue
+            sampler.record(host, update_time, data, device_hostname)
+            temp, state, exceeded = check_temperature(sampler, device_hostname, data, temp_threshold, host)
+            if exceeded:
+                return temp, state
+    finally:
+        subscription.close()
+
+
 def main():
     """
     This code will get a switch hostname from a Catalyst 9300 using NETCONF.
@@ -205,8 +1487,42 @@ def main():
     It will collect the switch temperature and temperature sensor state using NETCONF.
     The temperature info, and switch hostname, and IP addresses for "up" interfaces will be tweeted using
     the REST APIs from twitter.com
+    When started with a fleet inventory file, it will poll all the devices in the file instead, see load_fleet.
+    When started with --subscribe, the temperature is pushed by the switch, see TelemetrySubscription.
     """
 
+    parser = argparse.ArgumentParser(description='Catalyst 9300 NETCONF telemetry')
+    parser.add_argument('--fleet', help='CSV inventory file, poll all the devices in the file')
+    parser.add_argument('--interval', type=int, default=FLEET_INTERVAL, help='fleet sample interval, in seconds')
+    parser.add_argument('--workers', type=int, default=FLEET_WORKERS,
+                        help='maximum number of devices polled at the same time')
+    parser.add_argument('--threshold', type=int, default=TEMP_THRESHOLD,
+                        help='fleet and subscription temperature threshold, in Celsius')
+    parser.add_argument('--store', help='telemetry store directory, save the sensor readings, see telemetry_store.py')
+    parser.add_argument('--subscribe', action='store_true',
+                        help='receive the sensor and interface updates with YANG push, instead of polling')
+    args = parser.parse_args()
+
+    # the tweets are sent in the background, see AlertDispatcher
+
+    twitter = Twython(APP_KEY, APP_SECRET, OAUTH_TOKEN, OAUTH_TOKEN_SECRET)
+    dispatcher = AlertDispatcher(twitter)
+
+    store = None
+    if args.store:
+        from telemetry_store import TelemetryStore  # only required with "--store", needs NumPy
+        store = TelemetryStore(args.store)
+
+    if args.fleet:
+        poll_fleet(load_fleet(args.fleet), args.threshold, args.interval, args.workers, dispatcher, store)
+        netconf_pool.close()
+        config_cache.close()
+        dispatcher.close()
+        if store is not None:
+            store.close()
+        print('\n\nEnd of application run')
+        return
+
     print('\nThis simple code will use NETCONF to connect to a network device running 16.6.1\n')
 
     print('\nIP address or hostname of your Catalyst 9300 switch: HOST = ', HOST,
@@ -225,7 +1541,14 @@ def main():
     device_hostname = get_hostname()
     print('\nThe network device hostname is:', device_hostname)
 
-    while True:
+    # all the sensors are read with one NETCONF get, the threshold is checked on the smoothed inlet temperature
+
+    sampler = SensorSampler(store=store)
+
+    if args.subscribe:
+        temp, state = watch_temperature(device_hostname, args.threshold, sampler)
+
+    while not args.subscribe:
 
         # user input temperature threshold
 
@@ -237,36 +1560,30 @@ def main():
 
         # get temperature state
 
-        temp = int(get_temperature("Temp Sensor 0")[0])  # sensor 0 - inlet temperature, sensor 2 - switch temperature
-        state = get_temperature("Temp Sensor 0")[1]
-        print('\nSwitch ', device_hostname, ' intake temperature: ', temp, ' Celsius')
-        print('Switch ', device_hostname, ' temperature sensor state: ', state)
-        if temp <= temp_threshold:
-            print('Temperature is lower that threshold!')
+        temp, state, exceeded = check_temperature(sampler, device_hostname, sampler.sample(), temp_threshold)
+        if not exceeded:
             time.sleep(10)
         else:
-            print('\nSwitch ', device_hostname, ' intake temperature exceeded threshold')
             break
 
     # get the outdoor temp
 
     outside_temperature = get_outside_temperature()
+    if store is not None:
+        record_outside_temperature(store)
     print('\nLake Oswego, OR, Temperature is : ', outside_temperature, ' Celsius')
 
     # tweet the temperature info, see https://github.com/ryanmcgrath/twython for documentation
 
-    twitter = Twython(APP_KEY, APP_SECRET, OAUTH_TOKEN, OAUTH_TOKEN_SECRET)
     twitter_temp = device_hostname + ' ALERT: inlet air temp (in Celsius): ' + str(
         temp) + ', state: ' + state + ', Lake Oswego, OR, temp (in Celsius): ' + str(outside_temperature)
-    try:
-        twitter.update_status(status=twitter_temp)
-    except:
-        pass
+    dispatcher.alert((device_hostname, 'temperature'), twitter_temp)
     print('\nTweet temp status update: ', twitter_temp)
 
-    # get the device interfaces operational state up
+    # get the device interfaces operational state and IPv4 addresses, with one NETCONF get
 
-    interfaces_up_list = get_up_interfaces()
+    interfaces_info = get_interfaces_info()
+    interfaces_up_list = [intf for intf, info in interfaces_info.items() if info['oper-status'] == 'up']
     print('\nThe ', device_hostname, ' has these interfaces in a operational state "up" :')
     for intf in interfaces_up_list:
         print('    ', intf)
@@ -275,8 +1592,8 @@ def main():
 
     interface_info = []
     for intf in interfaces_up_list:
-        ip_address = get_interface_ip(intf)
-        if ip_address != 'not configured':  # append IP addresses only if they exist
+        ip_address = interfaces_info[intf]['ip']
+        if ip_address is not None:  # append IP addresses only if they exist
             interface_info.append({'interface': intf, 'ip address': ip_address})
 
     # collect IP addresses for the "up" interfaces
@@ -287,10 +1604,7 @@ def main():
 
     # tweet intf up IP addresses
 
-    try:
-        twitter.update_status(status=twitter_intf_up)
-    except:
-        pass
+    dispatcher.alert((device_hostname, 'interfaces'), twitter_intf_up)
     print('\nTweet interfaces "up" IP addresses: ', twitter_intf_up)
 
     # print interface info
@@ -300,6 +1614,12 @@ def main():
     for intf in interface_info:
         print(' {0:25} {1:20} '.format(intf['interface'], intf['ip address']))
 
+    netconf_pool.close()
+    config_cache.close()
+    dispatcher.close()
+    if store is not None:
+        store.close()
+
     print('\n\nEnd of application run')
 
 
@@ -0,0 +1,364 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+import argparse
+import random
+import socket
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import paramiko
+
+# stand-in NETCONF server, listening on localhost, used to test get_netconf_9300_info.py without a Catalyst 9300
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8300
+
+NETCONF_NS = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+NOTIFICATION_NS = 'urn:ietf:params:xml:ns:netconf:notification:1.0'
+MESSAGE_END = ']]>]]>'
+
+CAPABILITIES = [
+    'urn:ietf:params:netconf:base:1.0',
+    'urn:ietf:params:netconf:capability:notification:1.0',
+    'urn:ietf:params:xml:ns:yang:ietf-yang-push',
+    'http://cisco.com/ns/yang/Cisco-IOS-XE-native',
+    'http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper',
+    'urn:ietf:params:xml:ns:yang:ietf-interfaces'
+]
+
+
+class StubDevice(object):
+    """
+    The state of the simulated switch: hostname, interfaces and environment sensors.
+    The temperatures follow a random walk, updated each time they are read.
+    """
+
+    def __init__(self, hostname='C9300-STUB', interface_count=8, temperature=40):
+        self.hostname = hostname
+        self.interfaces = []
+        for index in range(1, interface_count + 1):
+            ip_address = '10.93.' + str(index) + '.1' if index % 2 else None
+            self.interfaces.append({'name': 'GigabitEthernet1/0/' + str(index),
+                                    'oper-status': 'up' if index % 3 else 'down',
+                                    'ip': ip_address})
+        self.sensors = [{'name': 'Temp Sensor ' + str(index), 'location': 'Switch 1',
+                         'current-reading': temperature + 2 * index, 'state': 'GREEN', 'sensor-units': 'Celsius'}
+                        for index in range(3)]
+        self.config_listeners = []
+        self._lock = threading.Lock()
+
+    def read_sensors(self):
+        with self._lock:
+            for sensor in self.sensors:
+                sensor['current-reading'] = max(0, sensor['current-reading'] + random.choice((-1, 0, 0, 1)))
+                sensor['state'] = 'GREEN' if sensor['current-reading'] < 50 else 'YELLOW'
+            return [dict(sensor) for sensor in self.sensors]
+
+    def set_oper_status(self, name, oper_status):
+        """
+        Change the operational state of the interface {name}, reported to the on-change subscriptions
+        """
+        with self._lock:
+            for interface in self.interfaces:
+                if interface['name'] == name:
+                    interface['oper-status'] = oper_status
+
+    def set_hostname(self, hostname):
+        """
+        Change the configured hostname, the sessions subscribed to the NETCONF stream get a config change notification
+        """
+        self.hostname = hostname
+        for listener in list(self.config_listeners):
+            listener()
+
+
+def native_xml(device):
+    return ('<native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"><hostname>' + device.hostname +
+            '</hostname></native>')
+
+
+def interfaces_state_xml(device, name=None, oper_status=None):
+    reply = '<interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">'
+    for interface in device.interfaces:
+        if name and interface['name'] != name:
+            continue
+        if oper_status and interface['oper-status'] != oper_status:
+            continue
+        reply += ('<interface><name>' + interface['name'] + '</name><type xmlns:ianaift="urn:ietf:params:xml:ns:'
+                  'yang:iana-if-type">ianaift:ethernetCsmacd</type><admin-status>up</admin-status><oper-status>' +
+                  interface['oper-status'] + '</oper-status></interface>')
+    return reply + '</interfaces-state>'
+
+
+def interfaces_xml(device, name=None):
+    reply = '<interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">'
+    for interface in device.interfaces:
+        if name and interface['name'] != name:
+            continue
+        reply += '<interface><name>' + interface['name'] + '</name><enabled>true</enabled>'
+        if interface['ip']:
+            reply += ('<ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip"><address><ip>' + interface['ip'] +
+                      '</ip><netmask>255.255.255.0</netmask></address></ipv4>')
+        reply += '</interface>'
+    return reply + '</interfaces>'
+
+
+def sensors_xml(device, name=None):
+    reply = '<environment-sensors xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-environment-oper">'
+    for sensor in device.read_sensors():
+        if name and sensor['name'] != name:
+            continue
+        reply += '<environment-sensor>'
+        for key in ('name', 'location', 'state', 'current-reading', 'sensor-units'):
+            reply += '<' + key + '>' + str(sensor[key]) + '</' + key + '>'
+        reply += '</environment-sensor>'
+    return reply + '</environment-sensors>'
+
+
+def filter_value(element, local_name):
+    """
+    Return the text of the first element {local_name} in the filter, used for the simple content match filters
+    """
+    for child in element.iter():
+        if child.tag.split('}')[-1] == local_name and child.text and child.text.strip():
+            return child.text.strip()
+
+
+def data_xml(device, filter_element):
+    """
+    Build the <data> content for the subtrees selected by the subtree filter {filter_element}
+    """
+    if filter_element is None:
+        return native_xml(device) + interfaces_xml(device) + interfaces_state_xml(device) + sensors_xml(device)
+    reply = ''
+    for selection in filter_element:
+        name = selection.tag.split('}')[-1]
+        if name == 'native':
+            reply += native_xml(device)
+        elif name == 'interfaces-state':
+            reply += interfaces_state_xml(device, filter_value(selection, 'name'),
+                                          filter_value(selection, 'oper-status'))
+        elif name == 'interfaces':
+            reply += interfaces_xml(device, filter_value(selection, 'name'))
+        elif name == 'environment-sensors':
+            reply += sensors_xml(device, filter_value(selection, 'name'))
+    return reply
+
+
+class NetconfSession(object):
+    """
+    One NETCONF session, over an SSH channel, using the base:1.0 framing
+    """
+
+    def __init__(self, channel, device, session_id):
+        self.channel = channel
+        self.device = device
+        self.session_id = session_id
+        self._buffer = ''
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def send(self, message):
+        with self._send_lock:
+            self.channel.sendall((message + MESSAGE_END).encode())
+
+    def receive(self):
+        while MESSAGE_END not in self._buffer:
+            data = self.channel.recv(65536)
+            if not data:
+                return None
+            self._buffer += data.decode()
+        message, self._buffer = self._buffer.split(MESSAGE_END, 1)
+        return message
+
+    def run(self):
+        hello = ('<?xml version="1.0" encoding="UTF-8"?><hello xmlns="' + NETCONF_NS + '"><capabilities>' +
+                 ''.join('<capability>' + capability + '</capability>' for capability in CAPABILITIES) +
+                 '</capabilities><session-id>' + str(self.session_id) + '</session-id></hello>')
+        try:
+            self.send(hello)
+            if self.receive() is None:
+                return
+            while not self._closed.is_set():
+                message = self.receive()
+                if message is None:
+                    break
+                self.handle(ET.fromstring(message.strip()))
+        except (socket.error, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            self._closed.set()
+            self.channel.close()
+
+    def reply(self, rpc, content):
+        self.send('<?xml version="1.0" encoding="UTF-8"?><rpc-reply xmlns="' + NETCONF_NS + '" message-id="' +
+                  rpc.get('message-id', '') + '">' + content + '</rpc-reply>')
+
+    def handle(self, rpc):
+        operation = rpc[0]
+        name = operation.tag.split('}')[-1]
+        if name in ('get', 'get-config'):
+            filter_element = operation.find('{' + NETCONF_NS + '}filter')
+            if filter_element is None:
+                filter_element = operation.find('filter')
+            self.reply(rpc, '<data>' + data_xml(self.device, filter_element) + '</data>')
+        elif name == 'establish-subscription':
+            self.establish_subscription(rpc, operation)
+        elif name == 'create-subscription':
+            self.device.config_listeners.append(self.config_changed)
+            self.reply(rpc, '<ok/>')
+        elif name == 'close-session':
+            self.reply(rpc, '<ok/>')
+            self._closed.set()
+        else:
+            self.reply(rpc, '<rpc-error><error-type>protocol</error-type><error-tag>operation-not-supported'
+                            '</error-tag><error-severity>error</error-severity></rpc-error>')
+
+    def establish_subscription(self, rpc, operation):
+        period = filter_value(operation, 'period')
+        dampening_period = filter_value(operation, 'dampening-period')
+        xpath = filter_value(operation, 'xpath-filter') or ''
+        subscription_id = random.randint(2147483648, 4294967295)
+        self.reply(rpc, '<subscription-result xmlns="urn:ietf:params:xml:ns:yang:ietf-event-notifications" '
+                        'xmlns:notif-bis="urn:ietf:params:xml:ns:yang:ietf-event-notifications">notif-bis:ok'
+                        '</subscription-result><subscription-id xmlns="urn:ietf:params:xml:ns:yang:'
+                        'ietf-event-notifications">' + str(subscription_id) + '</subscription-id>')
+
+        # the YANG push periods are in centiseconds, the on-change subscriptions are checked every 0.1 second
+
+        if period is None and dampening_period is not None:
+            interval = max(int(dampening_period), 10) / 100.0
+            on_change = True
+        else:
+            interval = int(period or 1000) / 100.0
+            on_change = False
+        thread = threading.Thread(target=self.push_updates, args=(subscription_id, xpath, interval, on_change))
+        thread.daemon = True
+        thread.start()
+
+    def push_updates(self, subscription_id, xpath, interval, on_change):
+        last_contents = None
+        while not self._closed.wait(0 if on_change and last_contents is None else interval):
+            if 'interfaces' in xpath:
+                contents = interfaces_state_xml(self.device)
+            else:
+                contents = sensors_xml(self.device)
+            if on_change:
+                if contents == last_contents:
+                    continue
+                update = 'push-change-update', 'datastore-changes-xml'
+            else:
+                update = 'push-update', 'datastore-contents-xml'
+            last_contents = contents
+            self.notify('<' + update[0] + ' xmlns="urn:ietf:params:xml:ns:yang:ietf-yang-push"><subscription-id>' +
+                        str(subscription_id) + '</subscription-id><' + update[1] + '>' + contents + '</' +
+                        update[1] + '></' + update[0] + '>')
+
+    def config_changed(self):
+        if self._closed.is_set():
+            self.device.config_listeners.remove(self.config_changed)
+            return
+        self.notify('<netconf-config-change xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-notifications">'
+                    '<changed-by><username>admin</username><session-id>0</session-id></changed-by>'
+                    '<datastore>running</datastore></netconf-config-change>')
+
+    def notify(self, content):
+        event_time = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.send('<?xml version="1.0" encoding="UTF-8"?><notification xmlns="' + NOTIFICATION_NS +
+                  '"><eventTime>' + event_time + '</eventTime>' + content + '</notification>')
+
+
+class SSHServer(paramiko.ServerInterface):
+    """
+    SSH server accepting any user name and password, and the netconf subsystem
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, channel_id):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name != 'netconf':
+            return False
+        self.server.start_session(channel)
+        return True
+
+
+class NetconfTestServer(object):
+    """
+    Stand-in NETCONF server simulating one Catalyst 9300, for tests.
+    It answers the get and get-config operations used by get_netconf_9300_info.py, the YANG push
+    establish-subscription, periodic or on-change, and the NETCONF stream create-subscription.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, device=None):
+        """
+        :param host: listening address
+        :param port: listening port, 0 for any free port
+        :param device: simulated device, StubDevice
+        """
+        self.device = device or StubDevice()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.listen(100)
+        self.port = self.socket.getsockname()[1]
+        self.session_count = 0
+        self._lock = threading.Lock()
+
+    def start_session(self, channel):
+        with self._lock:
+            self.session_count += 1
+            session_id = self.session_count
+        thread = threading.Thread(target=NetconfSession(channel, self.device, session_id).run)
+        thread.daemon = True
+        thread.start()
+
+    def serve_forever(self):
+        while True:
+            client, address = self.socket.accept()
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=SSHServer(self))
+
+    def start(self):
+        """
+        Serve in a background thread
+        :return: the listening port
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.port
+
+
+def main():
+    """
+    Run the stand-in NETCONF server. Use its address and port as the HOST and PORT in get_netconf_9300_info.py
+    """
+    parser = argparse.ArgumentParser(description='Stand-in Catalyst 9300 NETCONF server, for tests')
+    parser.add_argument('--host', default=SERVER_HOST, help='listening address')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='listening port')
+    args = parser.parse_args()
+    server = NetconfTestServer(args.host, args.port)
+    print('\nNETCONF test server listening on ', args.host, ' port ', server.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+
+# developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
+
+# !/usr/bin/env python3
+
+
+import argparse
+import calendar
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# the samples are stored in one directory for each partition, one file for each column
+
+PARTITION_SECONDS = 86400
+PARTITION_FORMAT = '%Y-%m-%d'
+
+# column name and type, the device and sensor names are stored as ids, see the names.json file
+
+COLUMNS = (('device', np.uint32), ('sensor', np.uint16), ('time', np.float64), ('value', np.float32))
+
+# number of samples kept in memory before they are appended to the column files
+
+FLUSH_SIZE = 1000
+
+# device and sensor names used to store the outside temperature
+
+OUTSIDE_DEVICE = 'weather.gov'
+OUTSIDE_SENSOR = 'outside temperature'
+
+# time bucket used to align the device samples and the outside temperature, in seconds
+
+CORRELATION_BUCKET = 3600
+
+
+class TelemetryStore(object):
+    """
+    Append only columnar store of the (device, sensor, time, value) samples, partitioned by day.
+    Each partition is a directory with one binary file for each column, the files are memory mapped when queried,
+    so the queries read only the partitions in the time range, and the columns are processed with NumPy.
+    The devices are identified by the polled host, their hostname is only kept as a label, see label().
+    """
+
+    def __init__(self, directory, flush_size=FLUSH_SIZE):
+        """
+        :param directory: store directory, created if missing
+        :param flush_size: number of samples kept in memory before they are written
+        """
+        self.directory = directory
+        self.flush_size = flush_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.names = {'device': [], 'sensor': []}
+        names_file = os.path.join(directory, 'names.json')
+        if os.path.isfile(names_file):
+            with open(names_file) as f:
+                self.names = json.load(f)
+        self.ids = dict((column, dict((name, index) for index, name in enumerate(names)))
+                        for column, names in self.names.items())
+        self.labels = {}
+        labels_file = os.path.join(directory, 'labels.json')
+        if os.path.isfile(labels_file):
+            with open(labels_file) as f:
+                self.labels = json.load(f)
+        self._labels_modified = False
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def _id(self, column, name):
+        if name not in self.ids[column]:
+            self.ids[column][name] = len(self.names[column])
+            self.names[column].append(name)
+        return self.ids[column][name]
+
+    def append(self, device, sensor, sample_time, value, label=None):
+        """
+        Add a sample, written to disk by flush(), or when {flush_size} samples are waiting
+        :param device: device IP address or hostname, as polled
+        :param sensor: sensor name
+        :param sample_time: sample time, in seconds since the epoch
+        :param value: sample value
+        :param label: device label, like the configured hostname, the last one is kept
+        :return: none
+        """
+        with self._lock:
+            if label is not None and self.labels.get(device) != label:
+                self.labels[device] = label
+                self._labels_modified = True
+            self._rows.append((self._id('device', device), self._id('sensor', sensor), sample_time, value))
+            if len(self._rows) >= self.flush_size:
+                self._flush()
+
+    def flush(self):
+        """
+        Append the samples waiting in memory to the column files
+        :return: none
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+
+        # the names are saved first, so the ids in the column files are always known
+
+        names_file = os.path.join(self.directory, 'names.json')
+        with open(names_file + '.tmp', 'w') as f:
+            json.dump(self.names, f)
+        os.replace(names_file + '.tmp', names_file)
+        if self._labels_modified:
+            labels_file = os.path.join(self.directory, 'labels.json')
+            with open(labels_file + '.tmp', 'w') as f:
+                json.dump(self.labels, f)
+            os.replace(labels_file + '.tmp', labels_file)
+            self._labels_modified = False
+        rows = np.array(self._rows, dtype=list(COLUMNS))
+        self._rows = []
+        partitions = (rows['time'] // PARTITION_SECONDS).astype(np.int64)
+        for partition in np.unique(partitions):
+            partition_dir = os.path.join(self.directory,
+                                         time.strftime(PARTITION_FORMAT, time.gmtime(partition * PARTITION_SECONDS)))
+            if not os.path.isdir(partition_dir):
+                os.makedirs(partition_dir)
+            partition_rows = rows[partitions == partition]
+            for column, dtype in COLUMNS:
+                with open(os.path.join(partition_dir, column), 'ab') as f:
+                    partition_rows[column].tofile(f)
+
+    def close(self):
+        self.flush()
+
+    def label(self, device):
+        """
+        :param device: device IP address or hostname, as polled
+        :return: the device label and the device, like "C9300 (10.1.1.1)", or the device if it has no label
+        """
+        label = self.labels.get(device)
+        return label + ' (' + device + ')' if label and label != device else device
+
+    def partitions(self, start=None, end=None):
+        """
+        :param start: start time, in seconds since the epoch
+        :param end: end time, in seconds since the epoch
+        :return: the partition directories overlapping the time range, oldest first
+        """
+        partition_dirs = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            partition_start = calendar.timegm(time.strptime(name, PARTITION_FORMAT))
+            if start is not None and partition_start + PARTITION_SECONDS <= start:
+                continue
+            if end is not None and partition_start >= end:
+                continue
+            partition_dirs.append(path)
+        return partition_dirs
+
+    def load(self, sensor=None, start=None, end=None, device=None):
+        """
+        Read the samples, the column files are memory mapped
+        :param sensor: sensor name, none for all the sensors
+        :param start: start time, in seconds since the epoch
+        :param end: end time, in seconds since the epoch
+        :param device: device IP address or hostname, as polled, none for all the devices
+        :return: dict {column: array}
+        """
+        self.flush()
+        columns = dict((column, []) for column, dtype in COLUMNS)
+        for partition_dir in self.partitions(start, end):
+            arrays = {}
+            for column, dtype in COLUMNS:
+                path = os.path.join(partition_dir, column)
+                arrays[column] = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.zeros(0, dtype)
+
+            # a partial write, if any, leaves the columns with different lengths, the incomplete rows are ignored
+
+            rows = min(len(array) for array in arrays.values())
+            mask = np.ones(rows, dtype=bool)
+            if sensor is not None:
+                mask &= arrays['sensor'][:rows] == self.ids['sensor'].get(sensor, -1)
+            if device is not None:
+                mask &= arrays['device'][:rows] == self.ids['device'].get(device, -1)
+            if start is not None:
+                mask &= arrays['time'][:rows] >= start
+            if end is not None:
+                mask &= arrays['time'][:rows] < end
+            for column, dtype in COLUMNS:
+                columns[column].append(arrays[column][:rows][mask])
+        return dict((column, np.concatenate(columns[column]) if columns[column] else np.zeros(0, dtype))
+                    for column, dtype in COLUMNS)
+
+    def _groups(self, samples):
+        """
+        :return: the device ids, and the samples values sorted by device then value, split by device
+        """
+        order = np.lexsort((samples['value'], samples['device']))
+        devices = samples['device'][order]
+        values = samples['value'][order]
+        device_ids, first = np.unique(devices, return_index=True)
+        return device_ids, np.split(values, first[1:])
+
+    def percentiles(self, sensor, percentiles=(50, 95, 99), start=None, end=None):
+        """
+        :param sensor: sensor name
+        :param percentiles: the percentiles to compute
+        :param start: start time, in seconds since the epoch
+        :param end: end time, in seconds since the epoch
+        :return: dict {device: array of the percentiles}
+        """
+        samples = self.load(sensor, start, end)
+        if not len(samples['value']):
+            return {}
+        device_ids, groups = self._groups(samples)
+        return dict((self.names['device'][device_id], np.percentile(values, percentiles))
+                    for device_id, values in zip(device_ids, groups))
+
+    def hottest(self, sensor, count=10, start=None, end=None, statistic='max'):
+        """
+        :param sensor: sensor name
+        :param count: number of devices returned
+        :param start: start time, in seconds since the epoch
+        :param end: end time, in seconds since the epoch
+        :param statistic: 'max' or 'mean'
+        :return: list of (device, value), hottest first
+        """
+        samples = self.load(sensor, start, end)
+        if not len(samples['value']):
+            return []
+        devices = samples['device'].astype(np.int64)
+        if statistic == 'mean':
+            values = (np.bincount(devices, weights=samples['value']) /
+                      np.maximum(np.bincount(devices), 1))
+        else:
+            values = np.full(devices.max() + 1, -np.inf)
+            np.maximum.at(values, devices, samples['value'])
+        present = np.flatnonzero(np.bincount(devices))
+        hottest = present[np.argsort(-values[present], kind='stable')[:count]]
+        return [(self.names['device'][device_id], float(values[device_id])) for device_id in hottest]
+
+    def correlation(self, sensor, start=None, end=None, bucket=CORRELATION_BUCKET):
+        """
+        Correlate the {sensor} readings of each device with the outside temperature, the samples are averaged
+        in time buckets first, so the devices and the outside temperature are compared at the same times.
+        :param sensor: sensor name
+        :param start: start time, in seconds since the epoch
+        :param end: end time, in seconds since the epoch
+        :param bucket: time bucket, in seconds
+        :return: dict {device: Pearson correlation coefficient}, NaN if not enough samples
+        """
+        outside = self.load(OUTSIDE_SENSOR, start, end, device=OUTSIDE_DEVICE)
+        samples = self.load(sensor, start, end)
+        if not len(outside['value']) or not len(samples['value']):
+            return {}
+        origin = min(outside['time'].min(), samples['time'].min())
+        outside_buckets = ((outside['time'] - origin) // bucket).astype(np.int64)
+        sample_buckets = ((samples['time'] - origin) // bucket).astype(np.int64)
+        bucket_count = int(max(outside_buckets.max(), sample_buckets.max())) + 1
+
+        # mean outside temperature in each bucket
+
+        outside_count = np.bincount(outside_buckets, minlength=bucket_count)
+        outside_mean = np.bincount(outside_buckets, weights=outside['value'], minlength=bucket_count) / np.maximum(
+            outside_count, 1)
+
+        # mean sensor reading for each device and bucket, in a devices x buckets matrix
+
+        devices = samples['device'].astype(np.int64)
+        cells = devices * bucket_count + sample_buckets
+        size = (int(devices.max()) + 1) * bucket_count
+        counts = np.bincount(cells, minlength=size).reshape(-1, bucket_count)
+        means = np.bincount(cells, weights=samples['value'], minlength=size).reshape(-1, bucket_count) / np.maximum(
+            counts, 1)
+
+        correlations = {}
+        for device_id in np.flatnonzero(counts.sum(axis=1)):
+            if self.names['device'][device_id] == OUTSIDE_DEVICE:
+                continue
+            both = (counts[device_id] > 0) & (outside_count > 0)
+            if both.sum() < 3 or means[device_id][both].std() == 0 or outside_mean[both].std() == 0:
+                correlations[self.names['device'][device_id]] = float('nan')
+                continue
+            correlations[self.names['device'][device_id]] = float(
+                np.corrcoef(means[device_id][both], outside_mean[both])[0, 1])
+        return correlations
+
+
+def main():
+    """
+    This code will print the fleet telemetry collected by get_netconf_9300_info.py with "--store":
+    the inlet temperature percentiles for each switch, the hottest switches, and the correlation of the
+    switches inlet temperature with the outside temperature.
+    """
+
+    parser = argparse.ArgumentParser(description='Fleet telemetry analytics')
+    parser.add_argument('directory', help='telemetry store directory')
+    parser.add_argument('--sensor', default='Temp Sensor 0', help='sensor name')
+    parser.add_argument('--days', type=float, default=30, help='number of days analyzed')
+    parser.add_argument('--top', type=int, default=10, help='number of hottest switches')
+    args = parser.parse_args()
+
+    store = TelemetryStore(args.directory)
+    end = time.time()
+    start = end - args.days * 86400
+
+    print('\nInlet temperature percentiles, last ', args.days, ' days:\n')
+    print(' {0:40} {1:>6} {2:>6} {3:>6}'.format('Switch', 'p50', 'p95', 'p99'))
+    for device, values in sorted(store.percentiles(args.sensor, start=start, end=end).items()):
+        print(' {0:40} {1:6.1f} {2:6.1f} {3:6.1f}'.format(store.label(device), *values))
+
+    print('\nHottest switches:\n')
+    for device, value in store.hottest(args.sensor, args.top, start, end):
+        print(' {0:40} {1:6.1f}'.format(store.label(device), value))
+
+    print('\nCorrelation with the outside temperature:\n')
+    for device, value in sorted(store.correlation(args.sensor, start, end).items()):
+        print(' {0:40} {1:6.2f}'.format(store.label(device), value))
+
+
+if __name__ == '__main__':
+    main()